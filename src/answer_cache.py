@@ -0,0 +1,102 @@
+import time
+from collections import OrderedDict
+import numpy as np
+from query_embedding_cache import normalize_query
+
+
+class AnswerCache:
+    """
+    LRU cache of complete chat answers (the SSE frames of a turn) with a TTL.
+
+    Exact key: (user_id, normalized query, chunk ids retrieved for the raw query,
+    prompt/model version, tenant index version). The retrieved chunk ids are part
+    of the key, so an answer is only replayed for the same evidence; the index
+    version drops every answer of a tenant when it is re-indexed.
+
+    On an exact miss, a semantic lookup compares the query embedding with the
+    cached questions that have the same evidence and version, and returns the
+    closest one at or above similarity_threshold (cosine).
+    """
+
+    def __init__(self, max_entries, ttl_seconds, similarity_threshold, prompt_version, index_versions):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.prompt_version = prompt_version
+        self.index_versions = index_versions
+        self.entries = OrderedDict()  # key -> (expires_at, query_vector, entry)
+        self.by_evidence = {}  # key[:1] + key[2:] -> set of keys, for the semantic lookup
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def key(self, user_id, query, chunk_ids):
+        return (user_id, normalize_query(query), tuple(chunk_ids), self.prompt_version, self.index_versions.version(user_id))
+
+    @staticmethod
+    def evidence(key):
+        return key[:1] + key[2:]
+
+    def get(self, key, query_vector=None):
+        """Cached entry for key, or for the most similar cached question with the same evidence."""
+        now = time.monotonic()
+        entry = self.lookup(key, now)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        if query_vector is not None and self.similarity_threshold is not None:
+            query_vector = np.asarray(query_vector, dtype=np.float32)
+            query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+            best_key, best_score = None, self.similarity_threshold
+            for other in list(self.by_evidence.get(self.evidence(key), ())):
+                cached = self.entries.get(other)
+                if cached is None or cached[1] is None:
+                    continue
+                score = float(np.dot(query_vector, cached[1]))
+                if score >= best_score:
+                    best_key, best_score = other, score
+            if best_key is not None:
+                entry = self.lookup(best_key, now)
+                if entry is not None:
+                    self.semantic_hits += 1
+                    return entry
+        self.misses += 1
+        return None
+
+    def lookup(self, key, now):
+        cached = self.entries.get(key)
+        if cached is None:
+            return None
+        if cached[0] < now:
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return cached[2]
+
+    def put(self, key, entry, query_vector=None):
+        if query_vector is not None:
+            query_vector = np.asarray(query_vector, dtype=np.float32)
+            query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, query_vector, entry)
+        self.entries.move_to_end(key)
+        self.by_evidence.setdefault(self.evidence(key), set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        self.entries.pop(key, None)
+        keys = self.by_evidence.get(self.evidence(key))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.by_evidence[self.evidence(key)]
+
+    def stats(self):
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.semantic_hits) / lookups, 3) if lookups else 0.0,
+        }
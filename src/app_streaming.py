@@ -1,18 +1,54 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import redis.asyncio as aioredis
-import json
+import asyncio, json
 from typing import Any, Dict, List
 # from conversation import EarningConversation
 from conversation_streaming import EarningConversation
 from retrieval import QuadrantRetrieval
 from redis_conversation_manager import AsyncConversationStore
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse
+from contextlib import asynccontextmanager
+from readiness import ReadinessChecks
 
-app = FastAPI()
 ec = EarningConversation()
 redis_store = AsyncConversationStore()
+readiness = ReadinessChecks(ec, redis_store)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the encoders, open the clients and check every connection in the background,
+    # each step bounded; /ready answers "loading" until they are done
+    warm_up_task = asyncio.create_task(readiness.warm_up())
+    yield
+    warm_up_task.cancel()
+    await readiness.close()
+    await ec.qd.close_client()
+    await ec.close_client()
+
+
+app = FastAPI(lifespan=lifespan)
+
+@app.get("/ready")
+async def ready():
+    """Per-dependency readiness, 503 until every dependency is up (for the load balancer)."""
+    await readiness.refresh()
+    return JSONResponse(readiness.report(), status_code=200 if readiness.ready() else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "speculation": ec.speculation_metrics,
+        "query_cache": ec.qd.query_cache.stats() if ec.qd.query_cache else None,
+        "result_cache": ec.qd.result_cache.stats() if ec.qd.result_cache else None,
+        "prompt_tokens": ec.prompt_assembler.metrics,
+        "answer_cache": ec.answer_cache.stats() if ec.answer_cache else None,
+        "coalescing": ec.single_flight.stats() if ec.single_flight else None,
+    }
+
 
 @app.post("/chat/")
 async def chat(user_id: str, user_query: str):
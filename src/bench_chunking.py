@@ -0,0 +1,80 @@
+"""
+Micro-benchmark of the chunkers on the dataset/ PDFs.
+
+Pages are extracted once, then each splitter is timed over every page (or every
+document for cross-page chunking). Run from src/ like data_indexing.py:
+
+    python bench_chunking.py --repeat 5
+"""
+import argparse, statistics, time
+from data_indexing import EarningCallIndexer
+
+
+def token_stats(chunks, tokenizer):
+    sizes = [len(tokenizer.offsets(chunk)) for chunk in chunks]
+    return {
+        "chunks": len(sizes),
+        "mean_tokens": round(statistics.mean(sizes), 1) if sizes else 0,
+        "min_tokens": min(sizes, default=0),
+        "max_tokens": max(sizes, default=0),
+        "under_half": sum(size < 0.5 * max(sizes) for size in sizes),
+    }
+
+
+def time_splitter(name, split_all, repeat, n_chars):
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        chunks = split_all()
+        timings.append(time.perf_counter() - start_time)
+    best = min(timings)
+    print(f"{name:<28} best {best * 1000:8.2f} ms  {n_chars / best / 1e6:7.2f} MB/s  {len(chunks) / best:10.0f} chunks/sec")
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    indexer = EarningCallIndexer()
+    if indexer.span_chunker is None:
+        raise SystemExit("set indexing.chunker.engine to 'span' in config.yaml to benchmark the span chunker")
+    span_chunker = indexer.span_chunker
+    pages_by_pdf = indexer.load_pages(list(indexer.pdf_mapping))
+    pages = [text for page_texts in pages_by_pdf.values() for _, text in page_texts]
+    n_chars = sum(len(text) for text in pages)
+    print(f"{len(pages)} pages, {n_chars / 1e6:.2f} MB of text\n")
+
+    def span_pages():
+        return [text[s:e] for text in pages for s, e in span_chunker.split(text)]
+
+    def span_cross_page():
+        chunks = []
+        for page_texts in pages_by_pdf.values():
+            document, spans = span_chunker.split_pages(page_texts)
+            chunks.extend(document[s:e] for s, e, _ in spans)
+        return chunks
+
+    results = {
+        "recursive_word_safe_split": time_splitter(
+            "recursive_word_safe_split",
+            lambda: [c for text in pages for c in indexer.recursive_word_safe_split(text, indexer.chunk_size, indexer.overlap)],
+            args.repeat, n_chars,
+        ),
+        "recursive_split": time_splitter(
+            "recursive_split",
+            lambda: [c for text in pages for c in indexer.recursive_split(text, indexer.chunk_size, indexer.overlap)],
+            args.repeat, n_chars,
+        ),
+        "span (per page)": time_splitter("span (per page)", span_pages, args.repeat, n_chars),
+        "span (cross page)": time_splitter("span (cross page)", span_cross_page, args.repeat, n_chars),
+    }
+
+    print("\nchunk sizes in tokenizer tokens:")
+    for name, chunks in results.items():
+        print(f"{name:<28} {token_stats(chunks, span_chunker.tokenizer)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Indexing benchmark over the dataset/ PDFs.
+
+Runs each ingestion stage on its own and reports:
+  extract   pages/sec of EarningCallIndexer.load_pages (thread and process modes)
+  chunk     chunks/sec of recursive_word_safe_split, recursive_split and the span chunker
+  embed     embeddings/sec of the dense and sparse models (embedding cache bypassed)
+  upsert    upserts/sec of QuadrantIndexer.upsert_points into QdrantClient(":memory:")
+plus peak RSS of this process and of its worker processes.
+
+Results are written as JSON; pass --compare with an earlier result file to flag
+regressions. Run from src/ like data_indexing.py:
+
+    python bench_indexing.py --output bench_results/run.json --compare bench_results/baseline.json
+"""
+import argparse, json, os, platform, resource, time
+import numpy as np
+from qdrant_client import QdrantClient
+from data_indexing import EarningCallIndexer, QuadrantIndexer
+from tenant_routing import TenantRouter
+
+STAGES = ("extract", "chunk", "embed", "upsert")
+
+
+def timed(fn):
+    start_time = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start_time
+
+
+def rate(count, elapsed):
+    return round(count / max(elapsed, 1e-9), 1)
+
+
+def bench_extract(indexer, results):
+    pages_by_pdf = None
+    for mode in ("thread", "process"):
+        indexer.ingestion_mode = mode
+        pages_by_pdf, elapsed = timed(lambda: indexer.load_pages(list(indexer.pdf_mapping)))
+        n_pages = sum(len(page_texts) for page_texts in pages_by_pdf.values())
+        results[f"extract_{mode}_pages_per_sec"] = rate(n_pages, elapsed)
+    return pages_by_pdf
+
+
+def bench_chunk(indexer, pages_by_pdf, results):
+    pages = [text for page_texts in pages_by_pdf.values() for _, text in page_texts]
+    splitters = {
+        "recursive_word_safe_split": lambda: [
+            c for text in pages for c in indexer.recursive_word_safe_split(text, indexer.chunk_size, indexer.overlap)
+        ],
+        "recursive_split": lambda: [
+            c for text in pages for c in indexer.recursive_split(text, indexer.chunk_size, indexer.overlap)
+        ],
+    }
+    if indexer.span_chunker is not None:
+        splitters["span_cross_page"] = lambda: [
+            document[s:e]
+            for page_texts in pages_by_pdf.values()
+            for document, spans in [indexer.span_chunker.split_pages(page_texts)]
+            for s, e, _ in spans
+        ]
+    chunks = []
+    for name, split_all in splitters.items():
+        chunks, elapsed = timed(split_all)
+        results[f"chunk_{name}_chunks_per_sec"] = rate(len(chunks), elapsed)
+    return chunks
+
+
+def bench_embed(qdrant_indexer, texts, results):
+    encoder = qdrant_indexer.encoder
+    encoder.cache = None  # measure the models, not the cache
+    # First call loads the model; time a second pass
+    encoder.encode_dense(texts[:8])
+    dense, elapsed = timed(lambda: encoder.encode_dense(texts))
+    results["embed_dense_per_sec"] = rate(len(texts), elapsed)
+    encoder.encode_sparse(texts[:8])
+    sparse, elapsed = timed(lambda: encoder.encode_sparse(texts))
+    results["embed_sparse_per_sec"] = rate(len(texts), elapsed)
+    return dense, sparse
+
+
+def random_vectors(n):
+    rng = np.random.default_rng(0)
+    dense = list(rng.random((n, 384), dtype=np.float32))
+    sparse = [(np.sort(rng.choice(30000, 64, replace=False)).astype(np.int32), rng.random(64, dtype=np.float32)) for _ in range(n)]
+    return dense, sparse
+
+
+def bench_upsert(qdrant_indexer, rows, dense, sparse, results):
+    if qdrant_indexer.router.layout == "shard_key":
+        qdrant_indexer.router = TenantRouter("shared")  # local mode has no custom sharding
+    client = QdrantClient(":memory:")
+    qdrant_indexer.create_index(client)
+    batch = [(i, row) for i, row in enumerate(rows)]
+    size = qdrant_indexer.batch_size
+
+    def upsert_all():
+        for start in range(0, len(batch), size):
+            qdrant_indexer.upsert_points(client, batch[start:start + size], dense[start:start + size], sparse[start:start + size])
+
+    _, elapsed = timed(upsert_all)
+    results["upserts_per_sec"] = rate(len(batch), elapsed)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return {
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_rss_children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print per-metric change vs. baseline; returns the throughput metrics that dropped by more than threshold."""
+    regressions = []
+    for key, value in results.items():
+        old = baseline.get(key)
+        if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old == 0:
+            continue
+        change = (value - old) / old
+        higher_is_better = not key.startswith("peak_rss")
+        regressed = change < -threshold if higher_is_better else change > threshold
+        print(f"{key:<45} {old:>12} -> {value:>12} ({change:+.1%}){'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--embed-limit", type=int, default=512, help="chunks to embed / upsert")
+    parser.add_argument("--output", default=f"bench_results/indexing-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    parser.add_argument("--compare", help="earlier result JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    pdf_indexer = EarningCallIndexer()
+    qdrant_indexer = QuadrantIndexer()
+    results = {"meta": {"timestamp": time.time(), "python": platform.python_version(), "cpu_count": os.cpu_count()}}
+
+    pages_by_pdf = pdf_indexer.load_pages(list(pdf_indexer.pdf_mapping))
+    if "extract" in args.stages:
+        pages_by_pdf = bench_extract(pdf_indexer, results)
+    rows = [
+        row
+        for pdf_name, page_texts in pages_by_pdf.items()
+        for row in pdf_indexer.chunk_pdf(pdf_name, pdf_indexer.pdf_mapping[pdf_name], page_texts)
+    ][:args.embed_limit]
+    if "chunk" in args.stages:
+        bench_chunk(pdf_indexer, pages_by_pdf, results)
+
+    texts = [row["text"] for row in rows]
+    if "embed" in args.stages:
+        dense, sparse = bench_embed(qdrant_indexer, texts, results)
+    else:
+        dense, sparse = random_vectors(len(texts))
+    if "upsert" in args.stages:
+        bench_upsert(qdrant_indexer, rows, dense, sparse, results)
+    results.update(peak_rss_mb())
+
+    print(json.dumps(results, indent=2))
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
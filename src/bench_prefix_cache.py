@@ -0,0 +1,192 @@
+"""
+Prefix-cache benchmark of the prompt assembly.
+
+Simulates --users concurrent chat sessions of --turns turns (breakdown + answer
+prompt per turn, users interleaved), built exactly like the API builds them, with
+chunk text from the chunk output as context and answers. Two history trimming
+strategies are compared:
+
+  sliding  history trimmed to the last `limit` messages on every save (previous behaviour)
+  stepped  history trimmed to `limit // 2` once it exceeds `limit` (AsyncConversationStore)
+
+Each prompt is rendered with the ChatML template and run through a model of vLLM's
+automatic prefix caching: KV blocks of --block-size tokens, hashed by their full
+prefix, kept in an LRU of --cache-blocks blocks. The report is the share of
+prompt tokens whose prefill is skipped, per stage.
+
+With --live every prompt is also sent to the vLLM server in config.yaml
+(max_tokens=1) and time-to-first-token is reported. Restart the server between
+strategies, or run one --strategy at a time, so they start from a cold cache.
+
+    python bench_prefix_cache.py --users 20 --turns 8
+"""
+import argparse, asyncio, hashlib, json, random, statistics, time
+from collections import OrderedDict
+import yaml
+from chunk_store import iter_chunk_rows
+from context_packing import ContextPacker
+from prompt_assembly import PromptAssembler
+from prompts import a_gen_system_prompt, a_gen_user_prompt, q_breakdown_system_prompt, q_breakdown_user_prompt
+from redis_conversation_manager import AsyncConversationStore
+
+
+class MemoryRedis:
+    """Just enough of redis.asyncio.Redis for AsyncConversationStore."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value):
+        self.data[key] = value
+
+
+class PrefixCacheModel:
+    """Block-level prefix cache: a block is reusable if the same token prefix ending at it was seen."""
+
+    def __init__(self, tokenizer, block_size, capacity):
+        self.tokenizer = tokenizer
+        self.block_size = block_size
+        self.capacity = capacity
+        self.blocks = OrderedDict()
+
+    def render(self, messages):
+        return "".join(f"<|im_start|>{m['role']}\n{m['content']}<|im_end|>\n" for m in messages) + "<|im_start|>assistant\n"
+
+    def process(self, messages):
+        """(prompt tokens, tokens served from cache) for one request."""
+        text = self.render(messages)
+        offsets = self.tokenizer.offsets(text)
+        digest = hashlib.sha1()
+        pos = 0
+        hit = True
+        cached = 0
+        for end in range(self.block_size, len(offsets) + 1, self.block_size):
+            block_end = offsets[end - 1][1]
+            digest.update(text[pos:block_end].encode("utf-8"))
+            pos = block_end
+            key = digest.hexdigest()
+            if hit and key in self.blocks:
+                cached += self.block_size
+                self.blocks.move_to_end(key)
+                continue
+            hit = False
+            self.blocks[key] = True
+            if len(self.blocks) > self.capacity:
+                self.blocks.popitem(last=False)
+        return len(offsets), cached
+
+
+def make_sessions(texts, users, turns, seed):
+    rng = random.Random(seed)
+    sessions = []
+    for _ in range(users):
+        session = []
+        for _ in range(turns):
+            words = rng.choice(texts).split()
+            session.append({
+                "query": " ".join(words[:rng.randint(6, 14)]) + "?",
+                "breakdown": "Reasoning: " + " ".join(words[:30]) + "\nAnswer:\n"
+                             + "\n".join(f"{i}. {' '.join(rng.choice(texts).split()[:8])}" for i in (1, 2, 3)),
+                "chunks": [{"pdf_name": "doc", "page": i, "chunk_id": i, "text": rng.choice(texts)} for i in range(5)],
+                "answer": "Reasoning: " + " ".join(rng.choice(texts).split()[:60]) + "\n\nAnswer: " + " ".join(words[:40]),
+            })
+        sessions.append(session)
+    return sessions
+
+
+async def time_to_first_token(client, model, messages):
+    start_time = time.perf_counter()
+    stream = await client.chat.completions.create(model=model, messages=messages, max_tokens=1, stream=True)
+    async for _ in stream:
+        break
+    await stream.response.aclose()
+    return time.perf_counter() - start_time
+
+
+async def run_strategy(name, sessions, args, packer, client, model):
+    store = AsyncConversationStore(limit=args.history_limit, trim_to=args.history_limit if name == "sliding" else None)
+    store.redis = MemoryRedis()
+    assembler = PromptAssembler(packer.tokenizer)
+    cache = PrefixCacheModel(packer.tokenizer, args.block_size, args.cache_blocks)
+    stats = {stage: {"prompt_tokens": 0, "cached_tokens": 0, "ttft": []} for stage in ("breakdown", "answer")}
+
+    async def send(stage, messages):
+        n_tokens, n_cached = cache.process(messages)
+        stats[stage]["prompt_tokens"] += n_tokens
+        stats[stage]["cached_tokens"] += n_cached
+        if client is not None:
+            stats[stage]["ttft"].append(await time_to_first_token(client, model, messages))
+
+    for turn in range(args.turns):
+        for u, session in enumerate(sessions):
+            user_id, step = f"{name}-user{u}", session[turn]
+            redis_id = f"{user_id}_q_breakdown"
+            messages, _ = assembler.build(
+                "breakdown", q_breakdown_system_prompt, await store.load(redis_id),
+                q_breakdown_user_prompt.format(user_query=step["query"]),
+            )
+            await send("breakdown", messages)
+            await store.append(redis_id, "user", step["query"])
+            await store.append(redis_id, "assistant", step["breakdown"])
+
+            context, _ = packer.pack(step["chunks"])
+            messages, _ = assembler.build(
+                "answer", a_gen_system_prompt, await store.load(user_id),
+                a_gen_user_prompt.format(user_query=step["query"], retrieved_text_chunks=context),
+            )
+            await send("answer", messages)
+            await store.append(user_id, "user", step["query"])
+            await store.append(user_id, "assistant", step["answer"])
+
+    print(f"\n{name}")
+    for stage, s in stats.items():
+        line = (f"  {stage:<10} {s['prompt_tokens']:>9} prompt tokens  {s['cached_tokens']:>9} from cache "
+                f"({s['cached_tokens'] / max(s['prompt_tokens'], 1):.1%})")
+        if s["ttft"]:
+            line += f"  ttft mean {statistics.mean(s['ttft']) * 1000:.1f} ms  p50 {statistics.median(s['ttft']) * 1000:.1f} ms"
+        print(line)
+    print("  avg tokens per prompt by segment:", json.dumps({
+        stage: {k: round(v / t["prompts"], 1) for k, v in t.items() if k != "prompts"}
+        for stage, t in assembler.metrics.items()
+    }))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--history-limit", type=int, default=10, help="AsyncConversationStore limit")
+    parser.add_argument("--block-size", type=int, default=16, help="vLLM KV block size in tokens")
+    parser.add_argument("--cache-blocks", type=int, default=50000, help="KV blocks the server can keep")
+    parser.add_argument("--strategy", choices=("sliding", "stepped", "both"), default="both")
+    parser.add_argument("--live", action="store_true", help="also measure TTFT against the configured vLLM server")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = yaml.safe_load(open("config.yaml"))
+    texts = [str(row["text"]) for row in iter_chunk_rows(config['chunk_format'], config['filename'], config['chunk_store_path'])]
+    if not texts:
+        raise SystemExit("no chunk output found, run data_indexing.py first")
+    packer = ContextPacker()
+    sessions = make_sessions(texts, args.users, args.turns, args.seed)
+
+    client, model = None, None
+    if args.live:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(base_url=config['openai']['vllm_api_url'], api_key=config['openai']['api_key'])
+        model = config['openai']['model']
+
+    strategies = ("sliding", "stepped") if args.strategy == "both" else (args.strategy,)
+    print(f"{args.users} users x {args.turns} turns, history limit {args.history_limit}, "
+          f"block size {args.block_size}, cache {args.cache_blocks} blocks")
+    for name in strategies:
+        await run_strategy(name, sessions, args, packer, client, model)
+    if client is not None:
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,165 @@
+import bisect, csv, json, mmap, os, shutil
+import numpy as np
+
+CSV_FIELDS = ["page", "chunk_id", "text", "user_id", "pdf_name"]
+ROW_DTYPE = np.dtype([("offset", "<i8"), ("length", "<i4"), ("page", "<i4"), ("chunk_id", "<i4")])
+
+
+class ChunkStoreWriter:
+    """
+    Streams chunk rows into a chunk store directory:
+
+      text.bin     utf-8 chunk texts back to back
+      rows.npy     fixed-width row table (offset, length, page, chunk_id) into text.bin
+      groups.json  row groups [{"user_id", "pdf_name", "start", "stop"}], one per run of rows
+                   with the same (user_id, pdf_name)
+
+    Files are written to <path>.tmp and swapped in on close(), so readers never see
+    a half-written store.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+        self.text_file = open(os.path.join(self.tmp_path, "text.bin"), "wb")
+        self.offset = 0
+        self.rows = []
+        self.groups = []
+
+    def write(self, row):
+        data = str(row["text"]).encode("utf-8")
+        self.text_file.write(data)
+        self.rows.append((self.offset, len(data), int(row["page"]), int(row["chunk_id"])))
+        self.offset += len(data)
+        key = (row["user_id"], row["pdf_name"])
+        if not self.groups or (self.groups[-1]["user_id"], self.groups[-1]["pdf_name"]) != key:
+            self.groups.append({"user_id": key[0], "pdf_name": key[1], "start": len(self.rows) - 1})
+        self.groups[-1]["stop"] = len(self.rows)
+
+    def close(self):
+        self.text_file.close()
+        np.save(os.path.join(self.tmp_path, "rows.npy"), np.array(self.rows, dtype=ROW_DTYPE))
+        with open(os.path.join(self.tmp_path, "groups.json"), "w") as f:
+            json.dump(self.groups, f)
+        old_path = f"{self.path}.old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.rename(self.path, old_path)
+        os.rename(self.tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def abort(self):
+        self.text_file.close()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+
+class CsvChunkWriter:
+    """Same interface as ChunkStoreWriter, for the all_pdf_chunk_mapping.csv format."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(f"{filename}.tmp", "w", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+        os.replace(f"{self.filename}.tmp", self.filename)
+
+    def abort(self):
+        self.file.close()
+        os.remove(f"{self.filename}.tmp")
+
+
+class ChunkStore:
+    """
+    Lazy reader for a chunk store written by ChunkStoreWriter.
+
+    The row table and the text blob are memory-mapped, so only the text of the
+    rows that are actually read is paged in; text_view() returns a zero-copy
+    memoryview into the blob.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "groups.json")) as f:
+            self.groups = json.load(f)
+        self.group_starts = [g["start"] for g in self.groups]
+        self.rows = np.load(os.path.join(path, "rows.npy"), mmap_mode="r")
+        self.blob = b""
+        with open(os.path.join(path, "text.bin"), "rb") as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.blob)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def row_ranges(self, user_id=None, pdf_name=None):
+        """(start, stop) row ranges of the groups matching user_id and/or pdf_name."""
+        return [
+            (g["start"], g["stop"])
+            for g in self.groups
+            if (user_id is None or g["user_id"] == user_id) and (pdf_name is None or g["pdf_name"] == pdf_name)
+        ]
+
+    def text_view(self, i):
+        offset, length = int(self.rows[i]["offset"]), int(self.rows[i]["length"])
+        return self.view[offset:offset + length]
+
+    def text(self, i):
+        return str(self.text_view(i), "utf-8")
+
+    def row(self, i):
+        group = self.groups[bisect.bisect_right(self.group_starts, i) - 1]
+        return {
+            "page": int(self.rows[i]["page"]),
+            "chunk_id": int(self.rows[i]["chunk_id"]),
+            "text": self.text(i),
+            "user_id": group["user_id"],
+            "pdf_name": group["pdf_name"],
+        }
+
+    def iter_rows(self, user_id=None, pdf_name=None):
+        for start, stop in self.row_ranges(user_id, pdf_name):
+            for i in range(start, stop):
+                yield self.row(i)
+
+
+def read_csv_rows(filename):
+    with open(filename, newline="") as f:
+        for row in csv.DictReader(f):
+            row["page"] = int(row["page"])
+            row["chunk_id"] = int(row["chunk_id"])
+            yield row
+
+
+def iter_chunk_rows(chunk_format, filename, store_path, pdf_names=None):
+    """
+    Chunk rows from the configured chunk format ("store" or "csv"), optionally only
+    those of pdf_names. Yields nothing if the chunk output does not exist yet.
+    """
+    if chunk_format == "store":
+        if not os.path.exists(store_path):
+            return
+        store = ChunkStore(store_path)
+        if pdf_names is None:
+            yield from store.iter_rows()
+        else:
+            for pdf_name in pdf_names:
+                yield from store.iter_rows(pdf_name=pdf_name)
+    elif os.path.exists(filename):
+        for row in read_csv_rows(filename):
+            if pdf_names is None or row["pdf_name"] in pdf_names:
+                yield row
+
+
+def open_chunk_writer(chunk_format, filename, store_path):
+    if chunk_format == "store":
+        return ChunkStoreWriter(store_path)
+    return CsvChunkWriter(filename)
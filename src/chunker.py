@@ -0,0 +1,114 @@
+import bisect, re
+
+# End of a sentence: terminal punctuation (plus closing quotes/brackets) followed by whitespace
+SENTENCE_END = re.compile(r'[.!?]["\'”’)\]]*(?=\s)')
+
+
+class WhitespaceTokenizer:
+    """Fallback tokenizer: one token per whitespace-separated word."""
+
+    def offsets(self, text):
+        return [m.span() for m in re.finditer(r'\S+', text)]
+
+
+class HFTokenizer:
+    """Character offsets of the embedding model's own tokens (HF tokenizers, shipped with fastembed)."""
+
+    def __init__(self, name):
+        from tokenizers import Tokenizer
+        self.tokenizer = Tokenizer.from_pretrained(name)
+        self.tokenizer.no_truncation()
+        self.tokenizer.no_padding()
+
+    def offsets(self, text):
+        return self.tokenizer.encode(text, add_special_tokens=False).offsets
+
+
+def load_tokenizer(name, fallback=True):
+    """
+    HFTokenizer for name. If it can't be loaded (e.g. offline), whitespace words are
+    counted instead, unless fallback is False: then the error is raised.
+    """
+    try:
+        return HFTokenizer(name)
+    except Exception as e:
+        if not fallback:
+            raise RuntimeError(f"Could not load tokenizer {name}: {e}") from e
+        print(f"Could not load tokenizer {name} ({e}), counting whitespace-separated words instead")
+        return WhitespaceTokenizer()
+
+
+class SpanChunker:
+    """
+    Single-pass chunker that returns (start, end) character spans into the text
+    instead of building new strings.
+
+    The text is tokenized once; each chunk takes up to max_tokens tokens and ends on
+    the last sentence boundary inside that window (falling back to the last word
+    boundary when the sentence would leave the chunk under half full). Consecutive
+    chunks overlap by overlap_tokens tokens, starting on a word boundary.
+    """
+
+    def __init__(self, max_tokens, overlap_tokens, tokenizer):
+        if max_tokens < 1:
+            raise ValueError(f"max_tokens must be at least 1, got {max_tokens}")
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError(f"overlap_tokens must be in [0, max_tokens), got {overlap_tokens} with max_tokens {max_tokens}")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = max(max_tokens // 2, 1)  # a chunk never ends where it starts
+        self.tokenizer = tokenizer
+
+    def split(self, text):
+        offsets = self.tokenizer.offsets(text)
+        n = len(offsets)
+        if n == 0:
+            return []
+        starts = [s for s, _ in offsets]
+        ends = [e for _, e in offsets]
+        # Token indexes a chunk may start at / end before without cutting a word
+        word_starts = [j for j in range(n) if j == 0 or starts[j] > ends[j - 1]]
+        word_starts.append(n)
+        sentence_breaks = []
+        for m in SENTENCE_END.finditer(text):
+            j = bisect.bisect_left(ends, m.end()) + 1
+            if j <= n and (not sentence_breaks or sentence_breaks[-1] < j):
+                sentence_breaks.append(j)
+
+        spans = []
+        start = 0
+        while start < n:
+            limit = start + self.max_tokens
+            if limit >= n:
+                end = n
+            else:
+                k = bisect.bisect_right(sentence_breaks, limit) - 1
+                if k >= 0 and sentence_breaks[k] - start >= self.min_tokens:
+                    end = sentence_breaks[k]
+                else:
+                    k = bisect.bisect_right(word_starts, limit) - 1
+                    end = word_starts[k] if word_starts[k] > start else limit
+            spans.append((starts[start], ends[end - 1]))
+            if end >= n:
+                break
+            k = bisect.bisect_left(word_starts, end - self.overlap_tokens)
+            start = max(min(word_starts[k], end), start + 1)
+        return spans
+
+    def split_pages(self, page_texts):
+        """
+        Chunk across page boundaries. page_texts is [(page_idx, text), ...] in page order.
+        Returns (document, [(start, end, page_idx), ...]) where page_idx is the page the chunk starts on.
+        """
+        page_starts, pages, parts, offset = [], [], [], 0
+        for page_idx, text in page_texts:
+            page_starts.append(offset)
+            pages.append(page_idx)
+            parts.append(text)
+            offset += len(text) + 1
+        document = " ".join(parts)
+        spans = [
+            (start, end, pages[bisect.bisect_right(page_starts, start) - 1])
+            for start, end in self.split(document)
+        ]
+        return document, spans
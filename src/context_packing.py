@@ -0,0 +1,100 @@
+import yaml
+from chunker import load_tokenizer
+
+
+PROBE_CHARS = 32
+
+
+def overlap_length(a, b):
+    """Length of the longest suffix of a that is a prefix of b (the chunker overlap)."""
+    probe = b[:PROBE_CHARS]
+    if not probe:
+        return 0
+    pos = a.find(probe, max(0, len(a) - len(b)))
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    # Overlaps shorter than the probe are compared directly; only whole words count,
+    # so a shared letter or space at the seam of unrelated chunks is not an overlap
+    for n in range(min(len(a), len(b), PROBE_CHARS - 1), 0, -1):
+        starts_word = n == len(a) or a[-n - 1].isspace() or b[0].isspace()
+        ends_word = n == len(b) or b[n].isspace() or b[n - 1].isspace()
+        if starts_word and ends_word and a.endswith(b[:n]):
+            return n
+    return 0
+
+
+class ContextPacker:
+    """
+    Turns the fused chunk payloads (best first) into the Context block of the
+    answer prompt, bounded by context.max_tokens.
+
+    Chunks of the same pdf with consecutive chunk ids are merged into one passage
+    (chunk ids run through the whole pdf, so this also joins chunks that start on
+    different pages) with the overlapping text dropped; a passage ranks where its
+    best chunk ranked and keeps the page its first chunk starts on. Passages are then taken in rank order until the budget runs
+    out, the last one cut at a token boundary if at least min_passage_tokens fit.
+    Tokens are counted with the answer model's tokenizer (whitespace words if it
+    cannot be loaded).
+    """
+
+    def __init__(self):
+        config = yaml.safe_load(open("config.yaml"))
+        self.context_config = config['context']
+        self.max_tokens = self.context_config['max_tokens']
+        self.min_passage_tokens = self.context_config['min_passage_tokens']
+        self.separator = "\n"
+        self.tokenizer = load_tokenizer(self.context_config['tokenizer'])
+        self.separator_tokens = len(self.tokenizer.offsets(self.separator))
+
+    def merge_passages(self, payloads):
+        """[{"pdf_name", "page", "chunk_ids", "text"}] in rank order, one per run of adjacent chunks."""
+        ranked = sorted(enumerate(payloads), key=lambda item: (item[1]["pdf_name"], item[1]["chunk_id"]))
+        passages = []  # (best rank, passage)
+        for rank, payload in ranked:
+            if passages:
+                best, last = passages[-1]
+                if last["pdf_name"] == payload["pdf_name"] and payload["chunk_id"] == last["chunk_ids"][-1] + 1:
+                    text = str(payload["text"])
+                    n = overlap_length(last["text"], text)
+                    last["text"] += text[n:] if n else " " + text
+                    last["chunk_ids"].append(payload["chunk_id"])
+                    passages[-1] = (min(best, rank), last)
+                    continue
+            passages.append((rank, {
+                "pdf_name": payload["pdf_name"],
+                "page": payload["page"],
+                "chunk_ids": [payload["chunk_id"]],
+                "text": str(payload["text"]),
+            }))
+        return [passage for _, passage in sorted(passages, key=lambda item: item[0])]
+
+    def pack(self, payloads):
+        """(context text, stats) for the answer prompt."""
+        passages = self.merge_passages(payloads)
+        texts = []
+        used = 0
+        cut = 0
+        for passage in passages:
+            offsets = self.tokenizer.offsets(passage["text"])
+            room = self.max_tokens - used - (self.separator_tokens if texts else 0)
+            if len(offsets) <= room:
+                texts.append(passage["text"])
+                used = self.max_tokens - room + len(offsets)
+                continue
+            if room >= max(self.min_passage_tokens, 1):
+                texts.append(passage["text"][:offsets[room - 1][1]])
+                used = self.max_tokens
+                cut = 1
+            break
+        stats = {
+            "chunks": len(payloads),
+            "passages": len(passages),
+            "packed_passages": len(texts),
+            "cut_passages": cut,
+            "dropped_passages": len(passages) - len(texts),
+            "input_tokens": sum(len(self.tokenizer.offsets(str(p["text"]))) for p in payloads),
+            "packed_tokens": used,
+        }
+        return self.separator.join(texts), stats
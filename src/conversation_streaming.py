@@ -1,14 +1,21 @@
 from openai import AsyncOpenAI
+import httpx
 from prompts import a_gen_system_prompt, a_gen_user_prompt
 from prompts import q_breakdown_system_prompt, q_breakdown_user_prompt
-from retrieval import QuadrantRetrieval
+from retrieval import create_retrieval
 from typing import AsyncGenerator
-import asyncio, json
+import asyncio, hashlib, json, re, time
 import yaml
-import pandas as pd
-from utils import parse_reasoning_and_output,parse_reasoning_and_queries
+from fusion import chunk_key, fuse_results
+from context_packing import ContextPacker
+from prompt_assembly import PromptAssembler
+from answer_cache import AnswerCache
+from index_versions import IndexVersions
+from query_embedding_cache import normalize_query
+from single_flight import SingleFlight
+from sse_frames import encode_event, token_frames
+from utils import parse_reasoning_and_output,parse_reasoning_and_queries, ExpandedQueryParser
 from redis_conversation_manager import AsyncConversationStore
-from retrieval import QuadrantRetrieval
 
 class EarningConversation:
     def __init__(self):
@@ -17,76 +24,113 @@ class EarningConversation:
         """
         config = yaml.safe_load(open("config.yaml"))
         self.openai_config = config['openai']
-        self.qd = QuadrantRetrieval()
+        self.vllm_api_url = self.openai_config['vllm_api_url']
+        self.api_key = self.openai_config['api_key']
+        self.model = self.openai_config['model']
+        self.generation_profiles = self.openai_config['profiles']
+        self._client = None
+        self.fusion_config = config['retrival']['fusion']
+        self.speculative_config = config['speculative']
+        self.speculation_metrics = {
+            "turns": 0,
+            "expansion_skipped": 0,  # should_expand said no
+            "expansion_timeouts": 0,
+            "expansion_errors": 0,
+            "expansion_merged": 0,
+            "expansion_changed_topk": 0,  # merged expansions that changed the final top-k
+        }
+        self.context_packer = ContextPacker()
+        self.prompt_assembler = PromptAssembler(self.context_packer.tokenizer)
+        self.qd = create_retrieval()
+        self.answer_cache = None
+        answer_cache_config = config['answer_cache']
+        if answer_cache_config['enabled']:
+            self.answer_cache = AnswerCache(
+                answer_cache_config['max_entries'],
+                answer_cache_config['ttl_seconds'],
+                answer_cache_config['similarity_threshold'],
+                self.compute_prompt_version(config),
+                IndexVersions(config['indexing']['index_versions_path']),
+            )
+        self.single_flight = SingleFlight() if config['coalescing']['enabled'] else None
+        self.streaming_config = config['streaming']
         
     
     async def get_client(self):
         """
-        Initialize the OpenAI client.
+        Shared OpenAI client (and httpx connection pool) for every LLM call in this
+        process, created on first use and kept open until close_client.
         """
-        self.vllm_api_url = self.openai_config['vllm_api_url']
-        self.api_key = self.openai_config['api_key']
-        self.model = self.openai_config['model']
-        client = AsyncOpenAI(
-            base_url=self.vllm_api_url,  # or your ngrok URL
-            api_key=self.api_key
-        )
-        return client
+        if self._client is None:
+            cc = self.openai_config['client']
+            self._client = AsyncOpenAI(
+                base_url=self.vllm_api_url,  # or your ngrok URL
+                api_key=self.api_key,
+                max_retries=cc['max_retries'],
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=cc['max_connections'],
+                        max_keepalive_connections=cc['max_keepalive_connections'],
+                        keepalive_expiry=cc['keepalive_expiry'],
+                    ),
+                    timeout=httpx.Timeout(cc['timeout'], connect=cc['connect_timeout']),
+                ),
+            )
+        return self._client
+
+    async def close_client(self):
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.close()
+
+    async def ping_llm(self):
+        """Check that the vLLM server answers."""
+        client = await self.get_client()
+        await client.models.list()
 
-    async def llm_call(self, client, conversation):
+    def generation_kwargs(self, stage):
+        """Sampling settings of a generation profile ("breakdown" or "answer")."""
+        profile = self.generation_profiles[stage]
+        kwargs = {
+            "max_tokens": profile['max_tokens'],
+            "temperature": profile['temperature'],
+            "top_p": profile['top_p'],
+            "frequency_penalty": profile['frequency_penalty'],
+            "presence_penalty": profile['presence_penalty'],
+        }
+        if profile.get('stop'):
+            kwargs["stop"] = profile['stop']
+        return kwargs
+
+    async def llm_call(self, client, conversation, stage="answer"):
         """
         Make a call to the OpenAI API.
         """
-        self.max_tokens = self.openai_config['max_tokens']
-        self.temperature = self.openai_config['temperature']
-        self.top_p = self.openai_config['top_p']
-        self.frequency_penalty = self.openai_config['frequency_penalty']
-        self.presence_penalty = self.openai_config['presence_penalty']
         response = await client.chat.completions.create(
             model=self.model,
             messages=conversation,
             # tools=tools,
             # tool_choice="auto",
-            max_tokens = self.max_tokens,
-            temperature = self.temperature,
-            top_p = self.top_p,
-            frequency_penalty = self.frequency_penalty,
-            presence_penalty = self.presence_penalty
+            **self.generation_kwargs(stage),
         )
         return response
     
-    async def stream_llm_call(self, client, conversation):
+    async def stream_llm_call(self, client, conversation, stage="answer"):
         """
         Streams model output token-by-token.
-        Returns the full accumulated message once complete.
         """
-        self.max_tokens = self.openai_config['max_tokens']
-        self.temperature = self.openai_config['temperature']
-        self.top_p = self.openai_config['top_p']
-        self.frequency_penalty = self.openai_config['frequency_penalty']
-        self.presence_penalty = self.openai_config['presence_penalty']
-
-        response_text = ""
         stream = await client.chat.completions.create(
             model=self.model,
             messages=conversation,
             stream=True,  # enable streaming
-            max_tokens=self.max_tokens,
-            temperature=self.temperature,
-            top_p=self.top_p,
-            frequency_penalty=self.frequency_penalty,
-            presence_penalty=self.presence_penalty
+            **self.generation_kwargs(stage),
         )
 
         async for chunk in stream:
             delta = chunk.choices[0].delta
             # print("delta----",delta)
             if delta and delta.content:
-                token = delta.content
-                response_text += token
-                yield token  # stream each token live
-
-        # return response_text
+                yield delta.content  # stream each token live
     
     async def create_conversation_with_history(self, user_id, user_query, retrieved_text_chunks, redis_store):
         """
@@ -94,10 +138,14 @@ class EarningConversation:
         """
         history = await redis_store.load(user_id)
         #print("history---------",history)
-        messages = [{"role": "system", "content": a_gen_system_prompt}]
-        if history:
-            messages.extend(history)
-        messages.append({"role": "user", "content": a_gen_user_prompt.format(user_query=user_query, retrieved_text_chunks=retrieved_text_chunks)})
+        # Stable system prompt first, volatile context last, for vLLM prefix caching
+        messages, token_counts = self.prompt_assembler.build(
+            "answer",
+            a_gen_system_prompt,
+            history,
+            a_gen_user_prompt.format(user_query=user_query, retrieved_text_chunks=retrieved_text_chunks),
+        )
+        print("answer prompt tokens--",token_counts)
         return messages
     
     async def start_process_with_history(self, user_id, user_query, retrieved_text_chunks, redis_store):
@@ -122,10 +170,11 @@ class EarningConversation:
 
         # print("conversation---------", conversation)
 
-        response_text = ""
+        parts = []
         async for token in self.stream_llm_call(client, conversation):
-            response_text += token
+            parts.append(token)
             yield token  # yield as stream to caller
+        response_text = "".join(parts)
 
         # once complete, parse and store
         print("final response_text---------",response_text)
@@ -145,66 +194,250 @@ class EarningConversation:
         reasoning, queries = parse_reasoning_and_queries(user_query)
         return queries
     
-    async def retrive_context_for_multiple_queries_stream(
-        self, user_id: str, user_query: str, redis_store
-    ) -> AsyncGenerator[str, None]:
+    async def stream_expanded_queries(self, user_id, user_query, redis_store):
         """
-        Async generator that:
-         1) runs query breakdown LLM (and saves q_breakdown history in redis)
-         2) runs retrieval for top 3 expanded queries in parallel
-         3) yields metadata_list (one event)
-         4) streams assistant tokens from start_process_with_history_stream as token events
-         5) yields final done event with parsed answer and metadata_list again for finality
+        Streams the query breakdown LLM call and yields each expanded query as soon as
+        its "N. ..." line after "Answer:" is complete. Generation is cancelled once 3
+        queries have been parsed. Only a breakdown that got that far (or ran to its
+        end) is saved as q_breakdown history in redis: if the stream fails or the
+        consumer cancels it (e.g. the speculative deadline), nothing is saved, so no
+        truncated turn ends up in later breakdown prompts.
         """
-        # 1) Generate query breakdown (same as before)
         client = await self.get_client()
         redis_id = f"{user_id}_q_breakdown"
         history = await redis_store.load(redis_id)
 
-        messages = [{"role": "system", "content": q_breakdown_system_prompt}]
-        if history:
-            messages.extend(history)
-        messages.append({"role": "user", "content": q_breakdown_user_prompt.format(user_query=user_query)})
+        messages, token_counts = self.prompt_assembler.build(
+            "breakdown",
+            q_breakdown_system_prompt,
+            history,
+            q_breakdown_user_prompt.format(user_query=user_query),
+        )
+        print("breakdown prompt tokens--",token_counts)
 
-        response = await self.llm_call(client, messages)
-        breakdown_content = response.choices[0].message.content
-        queries = await self.process_q_breakdown_response(breakdown_content)
-        queries = queries[0:3]  # keep first 3
+        stream = await client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            **self.generation_kwargs("breakdown"),
+        )
+        parser = ExpandedQueryParser()
+        parts = []
+        n_queries = 0
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta if chunk.choices else None
+                if not (delta and delta.content):
+                    continue
+                parts.append(delta.content)
+                for query in parser.feed(delta.content)[:3 - n_queries]:
+                    n_queries += 1
+                    yield query
+                if n_queries == 3:  # only the first 3 are used, stop paying for the rest
+                    break
+            else:
+                for query in parser.close()[:3 - n_queries]:
+                    n_queries += 1
+                    yield query
+        finally:
+            # Closing the connection makes vLLM abort the request
+            await stream.response.aclose()
 
-        await redis_store.append(redis_id, "user", user_query)
-        await redis_store.append(redis_id, "assistant", breakdown_content)
+        # Not in the finally: a cancelled or failed breakdown must not be saved
+        breakdown_content = "".join(parts)
+        if n_queries == 3:
+            breakdown_content = breakdown_content[:parser.pos].rstrip()  # drop the cut-off next line
+        # One write, so a cancellation can't leave the user message without its answer
+        await redis_store.extend(redis_id, [
+            {"role": "user", "content": user_query},
+            {"role": "assistant", "content": breakdown_content},
+        ])
 
-        tasks = [self.qd.process_search(query, user_id) for query in queries]
-        results = await asyncio.gather(*tasks)  # results: list of lists (or dfs) depending on qd
+    def should_expand(self, user_query):
+        """Cheap heuristic: short single-fact questions are answered well by the raw query alone."""
+        words = re.findall(r"[\w'$%.]+", user_query.lower())
+        if len(words) > self.speculative_config['short_query_words']:
+            return True
+        return any(word in self.speculative_config['expand_keywords'] for word in words) or user_query.count("?") > 1
 
-        all_df_list = [pd.DataFrame(i) for i in results if i]
-        if all_df_list:
-            df = pd.concat(all_df_list, ignore_index=True)
-        else:
-            df = pd.DataFrame(columns=["score", "payload"])
+    async def expand_and_search(self, user_id, user_query, redis_store):
+        """Expanded queries and their results, each query's search starting as soon as it is parsed."""
+        queries, tasks = [], []
+        try:
+            async for query in self.stream_expanded_queries(user_id, user_query, redis_store):
+                queries.append(query)
+                tasks.append(asyncio.create_task(self.qd.process_search_batch([query], user_id)))
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return queries, [metadata for (metadata,) in results]
 
-        if "score" in df.columns and len(df) > 0:
-            top_5 = df.sort_values("score", ascending=False).head(5)
+    async def retrieve_speculative(self, user_id, user_query, redis_store, raw_results=None):
+        """
+        Hybrid search on the raw user_query starts together with the query breakdown
+        (or is given as raw_results, when it already ran for the answer cache key).
+        Expanded-query results are fused in only if breakdown + search finish within
+        speculative.expansion_deadline seconds of the start of the turn; otherwise
+        (or if expansion fails) the raw-query results are used alone.
+        Returns (queries searched, fused top points).
+        """
+        metrics = self.speculation_metrics
+        metrics["turns"] += 1
+        start_time = time.perf_counter()
+        if raw_results is None:
+            raw_task = asyncio.create_task(self.qd.process_search_batch([user_query], user_id))
         else:
-            top_5 = df.head(5)
+            raw_task = asyncio.get_running_loop().create_future()
+            raw_task.set_result(raw_results)
+        if not self.should_expand(user_query):
+            metrics["expansion_skipped"] += 1
+            raw_results = await raw_task
+            return [user_query], fuse_results(raw_results, self.fusion_config['topn'], self.fusion_config['rrf_k'])
 
-        metadata_list = []
-        if not top_5.empty and "payload" in top_5.columns:
-            metadata_list = top_5["payload"].tolist()
-        else:
-            for res in results:
-                if isinstance(res, list):
-                    for item in res:
-                        # item might be dict-like
-                        if isinstance(item, dict) and "payload" in item:
-                            metadata_list.append(item["payload"])
-
-        if metadata_list:
-            retrieved_text_chunks = "\n".join([m.get("text", "") for m in metadata_list if isinstance(m, dict)])
+        expansion_task = asyncio.create_task(self.expand_and_search(user_id, user_query, redis_store))
+        try:
+            raw_results = await raw_task
+        except BaseException:
+            expansion_task.cancel()
+            raise
+        remaining = self.speculative_config['expansion_deadline'] - (time.perf_counter() - start_time)
+        expanded_queries, expanded_results = [], []
+        try:
+            expanded_queries, expanded_results = await asyncio.wait_for(expansion_task, max(remaining, 0))
+        except asyncio.TimeoutError:
+            metrics["expansion_timeouts"] += 1
+            print("query expansion missed the deadline, using the raw query only")
+        except Exception as e:
+            metrics["expansion_errors"] += 1
+            print("query expansion failed, using the raw query only--", e)
+
+        raw_top = fuse_results(raw_results, self.fusion_config['topn'], self.fusion_config['rrf_k'])
+        if not expanded_results:
+            return [user_query], raw_top
+        metrics["expansion_merged"] += 1
+        top_points = fuse_results(raw_results + expanded_results, self.fusion_config['topn'], self.fusion_config['rrf_k'])
+        if {chunk_key(p) for p in top_points} != {chunk_key(p) for p in raw_top}:
+            metrics["expansion_changed_topk"] += 1
+        return [user_query] + expanded_queries, top_points
+
+    def compute_prompt_version(self, config):
+        """Hash of everything besides the evidence that shapes an answer; part of the answer cache key."""
+        versioned = [
+            a_gen_system_prompt, a_gen_user_prompt, q_breakdown_system_prompt, q_breakdown_user_prompt,
+            self.model, self.generation_profiles, config['context'], self.fusion_config, self.speculative_config,
+        ]
+        return hashlib.sha256(json.dumps(versioned, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    async def answer_cache_key(self, user_id, user_query):
+        """
+        Answer cache key (with the chunk ids retrieved for the raw query), the query
+        embedding, and the raw-query results, which answer_stream reuses on a miss.
+        """
+        raw_results = await self.qd.process_search_batch([user_query], user_id)
+        raw_top = fuse_results(raw_results, self.fusion_config['topn'], self.fusion_config['rrf_k'])
+        key = self.answer_cache.key(user_id, user_query, [chunk_key(p) for p in raw_top])
+        query_vector = None
+        if self.answer_cache.similarity_threshold is not None:
+            dense_vectors, _ = await asyncio.to_thread(self.qd.encode_queries, [user_query])
+            query_vector = dense_vectors[0]
+        return key, query_vector, raw_results
+
+    def final_answer(self, done_frame):
+        """The answer text of a done event frame."""
+        return json.loads(done_frame[len(b"data: "):])["answer"]
+
+    async def retrive_context_for_multiple_queries_stream(
+        self, user_id: str, user_query: str, redis_store
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Streams the answer events of respond_stream. A question that the same tenant is
+        already asking (same normalized query, whatever the history) doesn't start a
+        pipeline of its own: it subscribes to the running one, replaying the events sent
+        so far. Every request still adds its own turn to the history, as it would without
+        coalescing (and as an answer cache hit does): the shared run saves the turn of the
+        request that started it, each joined request saves its turn once the run is done.
+        """
+        if self.single_flight is None:
+            async for frame in self.respond_stream(user_id, user_query, redis_store):
+                yield frame
+            return
+
+        key = (user_id, normalize_query(user_query))
+        flight, leader = self.single_flight.join(key, lambda: self.respond_stream(user_id, user_query, redis_store))
+        if not leader:
+            print("joined in-flight answer--",user_query)
+        last_frame = None
+        async for frame in self.single_flight.subscribe(key, flight):
+            last_frame = frame
+            yield frame
+        if not leader:
+            await redis_store.extend(user_id, [
+                {"role": "user", "content": user_query},
+                {"role": "assistant", "content": self.final_answer(last_frame)},
+            ])
+
+    async def respond_stream(
+        self, user_id: str, user_query: str, redis_store
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Streams the answer events of answer_stream, or replays a cached answer's events
+        at full speed when the same (or a semantically equivalent) question was answered
+        from the same evidence before. The raw-query retrieval that keys the cache is
+        passed on to answer_stream, so a speculative miss doesn't search twice.
+        """
+        if self.answer_cache is None:
+            async for frame in self.answer_stream(user_id, user_query, redis_store):
+                yield frame
+            return
+
+        key, query_vector, raw_results = await self.answer_cache_key(user_id, user_query)
+        entry = self.answer_cache.get(key, query_vector)
+        if entry is not None:
+            print("answer cache hit--",user_query)
+            for frame in entry["frames"]:
+                yield frame
+            await redis_store.extend(user_id, [
+                {"role": "user", "content": user_query},
+                {"role": "assistant", "content": entry["answer"]},
+            ])
+            return
+
+        frames = []
+        async for frame in self.answer_stream(user_id, user_query, redis_store, raw_results):
+            frames.append(frame)
+            yield frame
+        # Only complete turns get here; the last frame is the done event
+        self.answer_cache.put(key, {"frames": frames, "answer": self.final_answer(frames[-1])}, query_vector)
+
+    async def answer_stream(
+        self, user_id: str, user_query: str, redis_store, raw_results=None
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Async generator of encoded SSE frames that:
+         1) streams the query breakdown LLM (and saves q_breakdown history in redis)
+         2) runs retrieval for each of the top 3 expanded queries as soon as it is parsed
+            (in speculative mode: retrieval on the raw query runs alongside 1) and 2),
+            see retrieve_speculative; raw_results, when given, are the raw-query results
+            already fetched for the answer cache key and stand in for that search)
+         3) yields metadata_list (one event)
+         4) streams assistant tokens from start_process_with_history_stream as token events,
+            several tokens per event (streaming.max_delay / streaming.max_chars window)
+         5) yields final done event with the answer and metadata_list again for finality
+        """
+        if self.speculative_config['enabled']:
+            queries, top_points = await self.retrieve_speculative(user_id, user_query, redis_store, raw_results)
         else:
-            retrieved_text_chunks = ""
+            # raw_results only keyed the answer cache here: the evidence is the same with the cache off
+            queries, results = await self.expand_and_search(user_id, user_query, redis_store)
+            # Cross-query RRF, one slot per chunk
+            top_points = fuse_results(results, self.fusion_config['topn'], self.fusion_config['rrf_k'])
+        metadata_list = [point["payload"] for point in top_points]
 
-        print("len of retrieved_text_chunks--",len(retrieved_text_chunks))
+        # Merge overlapping chunks and fit them to the context token budget
+        retrieved_text_chunks, context_stats = self.context_packer.pack(metadata_list)
+        print("context packing--",context_stats)
         sanitized_metadata = []
         for d in metadata_list:
             if isinstance(d, dict):
@@ -218,25 +451,26 @@ class EarningConversation:
             "type": "metadata",
             "queries": queries,
             "metadata": sanitized_metadata,
+            "context_tokens": context_stats["packed_tokens"],
         }
-        yield f"data: {json.dumps(metadata_event, ensure_ascii=False)}\n\n"
+        yield encode_event(metadata_event)
 
         print("now calling llm for ans generation")
-        async for token in self.start_process_with_history_stream(user_id, user_query, retrieved_text_chunks, redis_store):
-            token_event = {"type": "token", "token": token}
-            yield f"data: {json.dumps(token_event, ensure_ascii=False)}\n\n"
-        
-        convo = await redis_store.load(user_id)
-        final_answer = ""
-        for msg in reversed(convo):
-            if msg.get("role") == "assistant":
-                final_answer = msg.get("content", "")
-                break
+        answer_parts = []
+
+        async def answer_tokens():
+            async for token in self.start_process_with_history_stream(user_id, user_query, retrieved_text_chunks, redis_store):
+                answer_parts.append(token)
+                yield token
+
+        async for frame in token_frames(answer_tokens(), self.streaming_config['max_delay'], self.streaming_config['max_chars']):
+            yield frame
 
+        # The answer is what was streamed, no need to read it back from redis
         done_event = {
             "type": "done",
-            "answer": final_answer,
+            "answer": "".join(answer_parts),
             "metadata": sanitized_metadata
         }
-        yield f"data: {json.dumps(done_event, ensure_ascii=False)}\n\n"
+        yield encode_event(done_event)
         
\ No newline at end of file
@@ -1,82 +1,356 @@
 import fitz  # PyMuPDF
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import re, yaml, tqdm
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED, ALL_COMPLETED
+from collections import deque
+from itertools import islice
+import os, re, time, yaml
 from qdrant_client import QdrantClient, models
+from index_manifest import IndexManifest, file_sha256, point_entry, point_id
+from index_versions import IndexVersions
+from embedding_encoder import EmbeddingEncoder, to_sparse_vector
+from chunk_store import iter_chunk_rows, open_chunk_writer
+from chunker import SpanChunker, load_tokenizer
+from tenant_routing import TenantRouter
+
+_worker_encoder = None
+
+
+def init_embed_worker(dense_model_name, sparse_model_name):
+    """Process-pool initializer: load both models once per embedding worker."""
+    global _worker_encoder
+    _worker_encoder = EmbeddingEncoder(dense_model_name, sparse_model_name)
+    _worker_encoder.dense_model()
+    _worker_encoder.sparse_model()
+
+
+def embed_texts(texts):
+    """Process-pool worker: dense and sparse embeddings for one batch of texts."""
+    return _worker_encoder.encode_dense(texts), _worker_encoder.encode_sparse(texts)
+
+
+def available_memory_bytes():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
 
 class QuadrantIndexer:
     def __init__(self):
         config = yaml.safe_load(open("config.yaml"))
         self.host = config['indexing']['quadrant_host']
         self.port =  config['indexing']['quadrant_port']
-        self.collection_name = config['indexing']['collection_name']
         self.filename = config['filename']
+        self.chunk_format = config['chunk_format']
+        self.chunk_store_path = config['chunk_store_path']
+        self.incremental = config['indexing'].get('incremental', False)
+        self.manifest_path = config['indexing'].get('manifest_path', 'index_manifest.json')
         self.dense_model_name = "sentence-transformers/all-MiniLM-L6-v2"
         self.sparse_model_name = "prithivida/Splade_PP_en_v1"
         self.dense_vector_name = "dense"
         self.sparse_vector_name = "sparse"
+        self.batch_size = config['embedding']['batch_size']
+        bulk_load_config = config['indexing']['bulk_load']
+        self.embed_workers = bulk_load_config['embed_workers']
+        self.worker_memory_mb = bulk_load_config['worker_memory_mb']
+        self.upload_concurrency = bulk_load_config['upload_concurrency']
+        self.collection_config = config['indexing']['collection']
+        self.router = TenantRouter()
+        self.tenants = sorted(set(config['pdf_mapping'].values()))
+        self.index_versions = IndexVersions(config['indexing']['index_versions_path'])
+        self.dirty_tenants = set()  # tenants whose points changed since the last publish_index_versions
+        self.encoder = EmbeddingEncoder(self.dense_model_name, self.sparse_model_name)
     
     def get_client(self):
         client = QdrantClient(host=self.host, 
                               port=self.port)
         return client
     
+    def quantization_config(self):
+        quantization = self.collection_config['quantization']
+        if not quantization['enabled']:
+            return None
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=quantization['quantile'],
+                always_ram=quantization['always_ram'],
+            )
+        )
+
+    def sparse_vector_params(self):
+        return models.SparseVectorParams(
+            index=models.SparseIndexParams(on_disk=self.collection_config['sparse_on_disk'])
+        )
+
+    def hnsw_config(self):
+        return models.HnswConfigDiff(
+            m=self.collection_config['hnsw']['m'],
+            ef_construct=self.collection_config['hnsw']['ef_construct'],
+        )
+
     def create_index(self,client):
+        for collection_name in self.router.collection_names(self.tenants):
+            self.create_collection(client, collection_name)
+        self.router.ensure_shard_keys(client, self.tenants)
+
+    def create_collection(self, client, collection_name):
         
-        if not client.collection_exists(self.collection_name):
+        if not client.collection_exists(collection_name):
             client.create_collection(
-                collection_name=self.collection_name,
+                collection_name=collection_name,
                 vectors_config={
                     self.dense_vector_name: models.VectorParams(
                         size=client.get_embedding_size(self.dense_model_name), 
-                        distance=models.Distance.COSINE
+                        distance=models.Distance.COSINE,
+                        on_disk=self.collection_config['on_disk_vectors'],
                     )
                 },  # size and distance are model dependent
-                sparse_vectors_config={self.sparse_vector_name: models.SparseVectorParams()},
+                sparse_vectors_config={self.sparse_vector_name: self.sparse_vector_params()},
+                hnsw_config=self.hnsw_config(),
+                quantization_config=self.quantization_config(),
+                on_disk_payload=self.collection_config['on_disk_payload'],
+                sharding_method=models.ShardingMethod.CUSTOM if self.router.layout == "shard_key" else None,
             )
         else:
-            print(f"Collection already exists--{self.collection_name}")
-    
-    def upload_data(self, client):
-        df = pd.read_csv(self.filename)
-        df = df.fillna('')
-        documents = []
-        metadata = []
-        for index, row in df.iterrows():
-            description = str(row["text"])
-            dense_document = models.Document(text=description, model=self.dense_model_name)
-            sparse_document = models.Document(text=description, model=self.sparse_model_name)
-            documents.append(
-                {
-                    self.dense_vector_name: dense_document,
-                    self.sparse_vector_name: sparse_document,
-                }
-            )
-            metadata.append(dict(row))
-        client.upload_collection(
-            collection_name=self.collection_name,
-            vectors=tqdm.tqdm(documents),
-            payload=metadata,
-            # parallel=4,  # Use 4 CPU cores to encode data.
-            # This will spawn a model per process, which might be memory expensive
-            # Make sure that your system does not use swap, and reduce the amount
-            # # of processes if it does. 
-            # Otherwise, it might significantly slow down the process.
-            # Requires wrapping code into if __name__ == '__main__' block
+            print(f"Collection already exists--{collection_name}")
+            self.migrate_collection(client, collection_name)
+        self.ensure_payload_indexes(client, collection_name)
+
+    def migrate_collection(self, client, collection_name):
+        """Apply the indexing.collection tuning to an existing collection in place."""
+        client.update_collection(
+            collection_name=collection_name,
+            vectors_config={
+                self.dense_vector_name: models.VectorParamsDiff(on_disk=self.collection_config['on_disk_vectors'])
+            },
+            sparse_vectors_config={self.sparse_vector_name: self.sparse_vector_params()},
+            hnsw_config=self.hnsw_config(),
+            quantization_config=self.quantization_config() or models.Disabled.DISABLED,
+            collection_params=models.CollectionParamsDiff(on_disk_payload=self.collection_config['on_disk_payload']),
         )
+        print(f"Collection settings updated--{collection_name}")
+
+    def ensure_payload_indexes(self, client, collection_name):
+        """Create the configured keyword payload indexes that the collection does not have yet."""
+        existing = client.get_collection(collection_name).payload_schema
+        for field_name, index_config in self.collection_config['payload_indexes'].items():
+            if field_name in existing:
+                continue
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=models.KeywordIndexParams(
+                    type=models.KeywordIndexType.KEYWORD,
+                    is_tenant=index_config['is_tenant'],
+                ),
+            )
+            print(f"Created payload index--{field_name}")
+
+    def embed_worker_count(self):
+        """Configured embedding workers, capped by CPU count and by MemAvailable / worker_memory_mb."""
+        if self.embed_workers <= 0:
+            return 0
+        by_memory = available_memory_bytes() // (self.worker_memory_mb * 1024 * 1024)
+        workers = max(1, min(self.embed_workers, by_memory, os.cpu_count() or 1))
+        if workers < self.embed_workers:
+            print(f"bulk load: capping embedding workers at {workers} (of {self.embed_workers}) for cpu/memory")
+        return workers
+
+    def upsert_points(self, client, batch, dense, sparse):
+        """Upsert one embedded batch, routed to each tenant's collection / shard key (nothing without a client)."""
+        if client is None:
+            # Embed-only run: the batch is in the embedding cache now
+            self.dirty_tenants.update(row["user_id"] for _, row in batch)
+            return len(batch)
+        points_by_tenant = {}
+        for (pid, row), d, s in zip(batch, dense, sparse):
+            points_by_tenant.setdefault(row["user_id"], []).append(
+                models.PointStruct(
+                    id=pid,
+                    vector={self.dense_vector_name: d.tolist(), self.sparse_vector_name: to_sparse_vector(s)},
+                    payload=dict(row),
+                )
+            )
+        for user_id, points in points_by_tenant.items():
+            route = self.router.route(user_id)
+            client.upsert(collection_name=route.collection_name, points=points, shard_key_selector=route.shard_key)
+        self.dirty_tenants.update(points_by_tenant)
+        return len(batch)
+
+    def delete_points(self, client, ids, user_ids):
+        """
+        Delete point ids from the collections / shard keys of user_ids, the tenants the
+        manifest recorded for them (see IndexManifest.tenants_for); these may no longer
+        be in pdf_mapping.
+        """
+        for collection_name, shard_keys in self.router.targets(user_ids):
+            client.delete(
+                collection_name=collection_name,
+                points_selector=models.PointIdsList(points=list(ids)),
+                shard_key_selector=shard_keys,
+            )
+        self.dirty_tenants.update(user_ids)
+
+    def publish_index_versions(self):
+        """Bump the index version of every tenant written to, invalidating their cached retrievals."""
+        self.index_versions.bump(self.dirty_tenants)
+        self.dirty_tenants = set()
+
+    def bulk_load(self, client, points):
+        """
+        Embed and upsert an iterable of (point_id, row) in batches of embedding.batch_size.
+
+        Batches are embedded by embed_workers processes (models loaded once per worker),
+        or in this process when embed_workers is 0, and each batch is upserted by a pool
+        of upload_concurrency threads as soon as its embeddings are ready. At most two
+        batches per worker/uploader are in flight, so points can be a lazy stream.
+        With client None the points are only embedded (filling the embedding cache).
+        Returns the number of points upserted (or embedded).
+        """
+        start_time = time.perf_counter()
+        workers = self.embed_worker_count()
+        embed_pool = None
+        if workers:
+            embed_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=init_embed_worker,
+                initargs=(self.dense_model_name, self.sparse_model_name),
+            )
+        upload_pool = ThreadPoolExecutor(max_workers=self.upload_concurrency)
+        embeds, uploads = {}, set()
+        n_upserted = 0
+
+        def collect_uploads(return_when):
+            nonlocal uploads, n_upserted
+            done, uploads = wait(uploads, return_when=return_when)
+            for future in done:
+                n_upserted += future.result()
+
+        def upload(batch, dense, sparse):
+            uploads.add(upload_pool.submit(self.upsert_points, client, batch, dense, sparse))
+            if len(uploads) >= 2 * self.upload_concurrency:
+                collect_uploads(FIRST_COMPLETED)
+
+        def collect_embeds(return_when):
+            done, _ = wait(embeds, return_when=return_when)
+            for future in done:
+                upload(embeds.pop(future), *future.result())
+
+        try:
+            points = iter(points)
+            while True:
+                batch = list(islice(points, self.batch_size))
+                if not batch:
+                    break
+                texts = [str(row["text"]) for _, row in batch]
+                if embed_pool is None:
+                    upload(batch, self.encoder.encode_dense(texts), self.encoder.encode_sparse(texts))
+                    continue
+                embeds[embed_pool.submit(embed_texts, texts)] = batch
+                if len(embeds) >= 2 * workers:
+                    collect_embeds(FIRST_COMPLETED)
+            if embeds:
+                collect_embeds(ALL_COMPLETED)
+            collect_uploads(ALL_COMPLETED)
+        finally:
+            if embed_pool is not None:
+                embed_pool.shutdown(cancel_futures=True)
+            upload_pool.shutdown(cancel_futures=True)
+
+        elapsed = time.perf_counter() - start_time
+        print(f"bulk load: upserted {n_upserted} chunks in {elapsed:.2f}s "
+              f"({n_upserted / max(elapsed, 1e-9):.1f} chunks/sec, {workers} embedding workers, "
+              f"{self.upload_concurrency} uploaders)")
+        return n_upserted
+
+    def upload_data(self, client):
+        rows = list(iter_chunk_rows(self.chunk_format, self.filename, self.chunk_store_path))
+        ids = [point_id(row["pdf_name"], row["page"], row["chunk_id"], str(row["text"])) for row in rows]
+
+        manifest = None
+        if self.incremental:
+            # Only embed new/changed chunks and drop the ones that disappeared
+            manifest = IndexManifest(self.manifest_path)
+            current = {pid: point_entry(row) for pid, row in zip(ids, rows)}
+            to_upsert, stale = manifest.diff_points(current)
+            # An existing id with a new payload hash means the pdf changed owner,
+            # so its old copy may sit in another tenant's collection / shard
+            moved = [pid for pid in to_upsert if pid in manifest.points]
+            if stale or moved:
+                self.delete_points(client, stale + moved, manifest.tenants_for(stale + moved, self.tenants))
+            print(f"incremental: {len(to_upsert)} chunks to upsert, {len(stale)} stale chunks deleted")
+            to_upsert = set(to_upsert)
+            rows, ids = zip(*[(row, pid) for row, pid in zip(rows, ids) if pid in to_upsert]) if to_upsert else ([], [])
+
+        # deterministic ids, so re-running overwrites instead of duplicating
+        self.bulk_load(client, zip(ids, rows))
+        if manifest is not None:
+            manifest.points = current
+            manifest.save()
+        self.publish_index_versions()
     
     def process(self):
         client = self.get_client()
         self.create_index(client)
         self.upload_data(client)   
-         
+
+
+def clean_page_text(page):
+    """Extract cleaned text from a single fitz page."""
+    text = page.get_text("text")
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def extract_page_range(pdf_path, start, end):
+    """
+    Process-pool worker: open pdf_path in this process and extract pages [start, end).
+    Returns a list of (page_idx, text) for the non-empty pages.
+    """
+    page_texts = []
+    with fitz.open(pdf_path) as doc:
+        for i in range(start, end):
+            text = clean_page_text(doc[i])
+            if text:
+                page_texts.append((i, text))
+    return page_texts
+
+
 class EarningCallIndexer:
     def __init__(self):
         config = yaml.safe_load(open("config.yaml"))
-        self.chunk_size = config["chunk_size"]
-        self.overlap = config["overlap"]
+        self.chunk_size = config['indexing']["chunk_size"]
+        self.overlap = config['indexing']["overlap"]
+        self.ingestion_mode = config['indexing'].get("ingestion_mode", "thread")
+        self.ingestion_workers = config['indexing'].get("ingestion_workers", 4)
+        self.page_batch_size = config['indexing'].get("page_batch_size", 0)
+        self.failed_pdfs = set()  # pdfs with a page range that couldn't be read in the last extraction
         self.pdf_mapping = config["pdf_mapping"]
         self.filename = config["filename"]
+        self.chunk_format = config['chunk_format']
+        self.chunk_store_path = config['chunk_store_path']
+        self.incremental = config['indexing'].get('incremental', False)
+        self.manifest_path = config['indexing'].get('manifest_path', 'index_manifest.json')
+        chunker_config = config['indexing']['chunker']
+        self.chunk_engine = chunker_config['engine']
+        self.cross_page = self.chunk_engine == "span" and chunker_config['cross_page']
+        self.span_chunker = None
+        if self.chunk_engine == "span":
+            self.span_chunker = SpanChunker(
+                chunker_config['max_tokens'],
+                chunker_config['overlap_tokens'],
+                # No whitespace fallback: max_tokens in words would overrun the model's
+                # token limit, and the manifest would mix word- and token-sized chunks
+                load_tokenizer(chunker_config['tokenizer'], fallback=False),
+            )
+        # Changing any chunking setting must re-chunk pdfs in incremental mode
+        self.chunking_signature = yaml.safe_dump(
+            {"chunker": chunker_config, "chunk_size": self.chunk_size, "overlap": self.overlap}, sort_keys=True
+        )
     
     def recursive_word_safe_split(self,text, chunk_size=1000, overlap=100):
         """
@@ -161,9 +435,7 @@ class EarningCallIndexer:
     
     def extract_text(self, page):
         """Extract cleaned text from a single page."""
-        text = page.get_text("text")
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text
+        return clean_page_text(page)
         
     def load_and_split_pdf(
         self,
@@ -196,35 +468,185 @@ class EarningCallIndexer:
                     print(f"Error reading page {page_idx}: {e}")
 
         # Sort and join
+        page_texts.sort(key=lambda x: x[0])
         return page_texts
-        # page_texts.sort(key=lambda x: x[0])
         # combined_text = "\n".join([t for _, t in page_texts])
         # chunks = self.recursive_split(combined_text, chunk_size, overlap)
         # return chunks
-    
+
+    def page_range_tasks(self, pdf_names, skip_first_n: int = 2, skip_last_m: int = 5):
+        """
+        Split the target pages of each PDF into (pdf_name, pdf_path, start, end) ranges
+        of page_batch_size pages (the whole file when page_batch_size is 0).
+        """
+        tasks = []
+        for pdf_name in pdf_names:
+            pdf_path = f"dataset/{pdf_name}.pdf"
+            with fitz.open(pdf_path) as doc:
+                total_pages = len(doc)
+            first, last = skip_first_n, total_pages - skip_last_m
+            step = self.page_batch_size if self.page_batch_size > 0 else max(last - first, 1)
+            for start in range(first, last, step):
+                tasks.append((pdf_name, pdf_path, start, min(start + step, last)))
+        return tasks
+
+    def load_pdfs_parallel(self, pdf_names, skip_first_n: int = 2, skip_last_m: int = 5):
+        """
+        Extract the pages of several PDFs with a process pool.
+        Each worker opens its own fitz document and handles one page range.
+        Returns {pdf_name: [(page_idx, text), ...]} in page order.
+        """
+        tasks = self.page_range_tasks(pdf_names, skip_first_n, skip_last_m)
+        results = {pdf_name: [] for pdf_name in pdf_names}
+        self.failed_pdfs = set()
+        with ProcessPoolExecutor(max_workers=self.ingestion_workers) as executor:
+            futures = {
+                executor.submit(extract_page_range, pdf_path, start, end): (pdf_name, start, end)
+                for pdf_name, pdf_path, start, end in tasks
+            }
+            for future in as_completed(futures):
+                pdf_name, start, end = futures[future]
+                try:
+                    results[pdf_name].extend(future.result())
+                except Exception as e:
+                    print(f"Error reading {pdf_name} pages {start}-{end}: {e}")
+                    self.failed_pdfs.add(pdf_name)
+
+        # Merge in deterministic page order
+        for page_texts in results.values():
+            page_texts.sort(key=lambda x: x[0])
+        return results
+
+    def iter_pages(self, pdf_names, skip_first_n: int = 2, skip_last_m: int = 5):
+        """
+        Stream (pdf_name, page_idx, text) in deterministic page order, one page range at a time.
+        In process mode at most 2 * ingestion_workers page ranges are in flight; a range
+        that fails is skipped and its pdf added to failed_pdfs.
+        """
+        tasks = self.page_range_tasks(pdf_names, skip_first_n, skip_last_m)
+        self.failed_pdfs = set()
+        if self.ingestion_mode != "process":
+            for pdf_name, pdf_path, start, end in tasks:
+                for page_idx, text in extract_page_range(pdf_path, start, end):
+                    yield pdf_name, page_idx, text
+            return
+
+        with ProcessPoolExecutor(max_workers=self.ingestion_workers) as executor:
+            in_flight = deque()
+            tasks = iter(tasks)
+            while True:
+                while len(in_flight) < 2 * self.ingestion_workers:
+                    task = next(tasks, None)
+                    if task is None:
+                        break
+                    pdf_name, pdf_path, start, end = task
+                    in_flight.append((pdf_name, start, end, executor.submit(extract_page_range, pdf_path, start, end)))
+                if not in_flight:
+                    break
+                pdf_name, start, end, future = in_flight.popleft()
+                try:
+                    page_texts = future.result()
+                except Exception as e:
+                    print(f"Error reading {pdf_name} pages {start}-{end}: {e}")
+                    self.failed_pdfs.add(pdf_name)
+                    continue
+                for page_idx, text in page_texts:
+                    yield pdf_name, page_idx, text
+
+    def load_pages(self, pdf_names):
+        """
+        Extract the pages of the given PDFs using the configured ingestion_mode
+        and report extraction throughput in pages/sec.
+        """
+        start_time = time.perf_counter()
+        if self.ingestion_mode == "process":
+            pages_by_pdf = self.load_pdfs_parallel(pdf_names)
+        else:
+            pages_by_pdf = {k: self.load_and_split_pdf(f"dataset/{k}.pdf") for k in pdf_names}
+        elapsed = time.perf_counter() - start_time
+        total_pages = sum(len(page_texts) for page_texts in pages_by_pdf.values())
+        print(f"extracted {total_pages} pages in {elapsed:.2f}s "
+              f"({total_pages / max(elapsed, 1e-9):.1f} pages/sec, mode={self.ingestion_mode})")
+        return pages_by_pdf
+
+    def make_rows(self, pdf_name, user_id, chunks, first_chunk_id):
+        """chunks is [(page_idx, text), ...]; chunk ids continue from first_chunk_id within the pdf."""
+        return [
+            {
+                "page": page_idx + 1,   # +1 for human-readable numbering
+                "chunk_id": first_chunk_id + i,
+                "text": chunk,
+                "user_id": user_id,
+                "pdf_name": pdf_name,
+            }
+            for i, (page_idx, chunk) in enumerate(chunks)
+        ]
+
+    def chunk_page(self, pdf_name, user_id, page_idx, text, first_chunk_id):
+        """Split one page into chunk rows."""
+        if self.span_chunker is not None:
+            chunks = [text[start:end] for start, end in self.span_chunker.split(text)]
+        else:
+            chunks = self.recursive_word_safe_split(text, self.chunk_size, self.overlap)
+        return self.make_rows(pdf_name, user_id, [(page_idx, chunk) for chunk in chunks], first_chunk_id)
+
+    def chunk_pdf(self, pdf_name, user_id, page_texts):
+        """Split all pages of one pdf into chunk rows, across page boundaries when cross_page is set."""
+        if self.cross_page:
+            document, spans = self.span_chunker.split_pages(page_texts)
+            return self.make_rows(pdf_name, user_id, [(page_idx, document[start:end]) for start, end, page_idx in spans], 0)
+        rows = []
+        for page_idx, text in page_texts:
+            rows.extend(self.chunk_page(pdf_name, user_id, page_idx, text, len(rows)))
+        return rows
+
+    def unchanged_pdfs(self, manifest, pdf_hashes):
+        """PDFs whose hash, owner and chunking settings match the manifest and that have previous chunk rows."""
+        unchanged = {
+            k for k, v in self.pdf_mapping.items()
+            if manifest.pdf_unchanged(k, pdf_hashes[k], v, self.chunking_signature)
+        }
+        if not unchanged:
+            return set()
+        return {row["pdf_name"] for row in iter_chunk_rows(self.chunk_format, self.filename, self.chunk_store_path, unchanged)}
 
     def index_pdf(self):
-        all_pdf_chunk_mapping = []
-        for k, v in self.pdf_mapping.items():
-            pdf_path = f"dataset/{k}.pdf"
-            page_texts = self.load_and_split_pdf(pdf_path)
-            chunk_mappings = []
-            chunk_id = 0
-            for page_idx, text in page_texts:
-                chunks = self.recursive_word_safe_split(text, self.chunk_size, self.overlap)
-                for chunk in chunks:
-                    chunk_mappings.append({
-                        "page": page_idx + 1,   # +1 for human-readable numbering
-                        "chunk_id": chunk_id,
-                        "text": chunk,
-                        "user_id": v,
-                        "pdf_name": k,
-                    })
-                    chunk_id += 1
-            all_pdf_chunk_mapping.extend(chunk_mappings)
-            print("len of all_pdf_chunk_mapping-----"), len(all_pdf_chunk_mapping)
-        df = pd.DataFrame(all_pdf_chunk_mapping)
-        df.to_csv(self.filename, index=False)
+        unchanged = set()
+        if self.incremental:
+            manifest = IndexManifest(self.manifest_path)
+            pdf_hashes = {k: file_sha256(f"dataset/{k}.pdf") for k in self.pdf_mapping}
+            unchanged = self.unchanged_pdfs(manifest, pdf_hashes)
+            print(f"incremental: reusing {len(unchanged)} unchanged pdfs, "
+                  f"extracting {len(self.pdf_mapping) - len(unchanged)}")
+        pages_by_pdf = self.load_pages([k for k in self.pdf_mapping if k not in unchanged])
+        writer = open_chunk_writer(self.chunk_format, self.filename, self.chunk_store_path)
+        try:
+            # Rows of unchanged pdfs are copied straight from the previous output, which
+            # is only replaced on close
+            if unchanged:
+                for row in iter_chunk_rows(self.chunk_format, self.filename, self.chunk_store_path, unchanged):
+                    writer.write(row)
+            n_rows = 0
+            for k, v in self.pdf_mapping.items():
+                if k in unchanged:
+                    continue
+                for row in self.chunk_pdf(k, v, pages_by_pdf.pop(k)):
+                    writer.write(row)
+                    n_rows += 1
+                print("len of all_pdf_chunk_mapping-----", n_rows)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        if self.incremental:
+            for k, v in self.pdf_mapping.items():
+                # A pdf with unread pages isn't recorded as indexed, so the next run extracts it again
+                if k in self.failed_pdfs:
+                    manifest.invalidate_pdf(k)
+                else:
+                    manifest.set_pdf(k, pdf_hashes[k], v, self.chunking_signature)
+            manifest.retain_pdfs(self.pdf_mapping)
+            manifest.save()
         
 
             
@@ -0,0 +1,240 @@
+import fcntl, hashlib, os
+from contextlib import contextmanager
+import numpy as np
+
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def model_slug(model_name):
+    return model_name.replace("/", "__")
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk store of one model's embeddings.
+
+    Files in the store directory:
+      values.f32   float32 payload (dense rows, or sparse values), memory-mapped for reads
+      indices.i32  int32 sparse indices aligned with values.f32 (sparse models only)
+      index.log    "key offset length" lines, offsets in elements
+
+    Data is appended before its index line, so a crash never leaves the index
+    pointing at missing data. Writers hold an exclusive flock, readers a shared
+    one, which lets the indexer and the API processes share a cache directory.
+
+    A cache hit appends the entry's line again, so the log order is the recency
+    order of every process and run that used the store: an entry's last line is
+    its last use. When the store grows past max_bytes the least recently used
+    entries are dropped and the files are rewritten; when repeated lines
+    outnumber the entries, only the log is rewritten.
+    """
+
+    def __init__(self, path, sparse, max_bytes):
+        os.makedirs(path, exist_ok=True)
+        self.values_path = os.path.join(path, "values.f32")
+        self.indices_path = os.path.join(path, "indices.i32")
+        self.log_path = os.path.join(path, "index.log")
+        self.lock_path = os.path.join(path, "lock")
+        self.sparse = sparse
+        self.max_bytes = max_bytes
+        self.bytes_per_element = 8 if sparse else 4
+        self.entries = {}  # key -> [offset, length, position of its last line in the log]
+        self.log_lines = 0
+        self.log_ino = None
+        self.log_pos = 0
+        self.values = None
+        self.indices = None
+        with self.locked(fcntl.LOCK_SH):
+            self.refresh()
+
+    @contextmanager
+    def locked(self, mode):
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def refresh(self):
+        """Pick up entries appended, or a compaction done, by another process. Call under a lock."""
+        if not os.path.exists(self.log_path):
+            return
+        st = os.stat(self.log_path)
+        if st.st_ino != self.log_ino:
+            self.entries, self.log_pos, self.log_lines, self.log_ino = {}, 0, 0, st.st_ino
+            self.values = self.indices = None
+        if st.st_size > self.log_pos:
+            with open(self.log_path, "rb") as f:
+                f.seek(self.log_pos)
+                data = f.read()
+            self.log_pos += len(data)
+            for line in data.decode().splitlines():
+                key, offset, length = line.split()
+                self.log_lines += 1
+                self.entries[key] = [int(offset), int(length), self.log_lines]
+        self.remap()
+
+    def remap(self):
+        size = os.path.getsize(self.values_path) // 4 if os.path.exists(self.values_path) else 0
+        if size == 0:
+            self.values = self.indices = None
+            return
+        if self.values is None or len(self.values) != size:
+            self.values = np.memmap(self.values_path, dtype=np.float32, mode="r", shape=(size,))
+            if self.sparse:
+                self.indices = np.memmap(self.indices_path, dtype=np.int32, mode="r", shape=(size,))
+
+    def size_bytes(self):
+        return sum(length for _, length, _ in self.entries.values()) * self.bytes_per_element
+
+    def get_many(self, keys):
+        """Cached embeddings for keys, None where missing. Sparse entries are (indices, values)."""
+        if any(key not in self.entries for key in keys):
+            with self.locked(fcntl.LOCK_SH):
+                self.refresh()
+        results = []
+        for key in keys:
+            entry = self.entries.get(key)
+            if entry is None:
+                results.append(None)
+                continue
+            offset, length, _ = entry
+            values = np.array(self.values[offset:offset + length])
+            if self.sparse:
+                results.append((np.array(self.indices[offset:offset + length]), values))
+            else:
+                results.append(values)
+        hits = [key for key, result in zip(keys, results) if result is not None]
+        if hits:
+            self.touch(hits)
+        return results
+
+    def touch(self, keys):
+        """Append the log lines of keys again, marking them as the most recently used."""
+        with self.locked(fcntl.LOCK_EX):
+            self.refresh()
+            lines = []
+            for key in dict.fromkeys(keys):
+                entry = self.entries.get(key)
+                if entry is None:  # evicted by another process meanwhile
+                    continue
+                self.log_lines += 1
+                entry[2] = self.log_lines
+                lines.append(f"{key} {entry[0]} {entry[1]}\n")
+            if not lines:
+                return
+            with open(self.log_path, "ab") as f:
+                f.write("".join(lines).encode())
+            self.log_pos = os.stat(self.log_path).st_size
+            if self.log_lines > 2 * len(self.entries) + 1024:
+                self.rewrite_log(self.entries)
+
+    def put_many(self, items):
+        """Append (key, values, indices) items; indices is None for dense models."""
+        with self.locked(fcntl.LOCK_EX):
+            self.refresh()
+            offset = os.path.getsize(self.values_path) // 4 if os.path.exists(self.values_path) else 0
+            values_blob, indices_blob, lines = [], [], []
+            for key, values, indices in items:
+                if key in self.entries:
+                    continue
+                values = np.asarray(values, dtype=np.float32)
+                values_blob.append(values.tobytes())
+                if self.sparse:
+                    indices_blob.append(np.asarray(indices, dtype=np.int32).tobytes())
+                self.log_lines += 1
+                self.entries[key] = [offset, len(values), self.log_lines]
+                lines.append(f"{key} {offset} {len(values)}\n")
+                offset += len(values)
+            if not lines:
+                return
+            with open(self.values_path, "ab") as f:
+                f.write(b"".join(values_blob))
+            if self.sparse:
+                with open(self.indices_path, "ab") as f:
+                    f.write(b"".join(indices_blob))
+            with open(self.log_path, "ab") as f:
+                f.write("".join(lines).encode())
+            st = os.stat(self.log_path)
+            self.log_ino, self.log_pos = st.st_ino, st.st_size
+            self.remap()
+            if self.size_bytes() > self.max_bytes:
+                self.compact()
+
+    def compact(self):
+        """Keep the most recently used entries up to 75% of max_bytes and rewrite the files. Call under LOCK_EX."""
+        budget = int(self.max_bytes * 0.75) // self.bytes_per_element
+        keep, total = [], 0
+        for key, (offset, length, last_used) in sorted(self.entries.items(), key=lambda kv: -kv[1][2]):
+            if total + length > budget:
+                continue
+            keep.append((key, offset, length))
+            total += length
+        keep.sort(key=lambda item: item[1])
+
+        entries, new_offset = {}, 0
+        for key, offset, length in keep:
+            entries[key] = [new_offset, length, self.entries[key][2]]
+            new_offset += length
+        with open(f"{self.values_path}.tmp", "wb") as f:
+            for _, offset, length in keep:
+                f.write(self.values[offset:offset + length].tobytes())
+        if self.sparse:
+            with open(f"{self.indices_path}.tmp", "wb") as f:
+                for _, offset, length in keep:
+                    f.write(self.indices[offset:offset + length].tobytes())
+        self.values = self.indices = None
+        os.replace(f"{self.values_path}.tmp", self.values_path)
+        if self.sparse:
+            os.replace(f"{self.indices_path}.tmp", self.indices_path)
+        print(f"embedding cache: evicted {len(self.entries) - len(entries)} entries from {self.values_path}")
+        self.rewrite_log(entries)
+
+    def rewrite_log(self, entries):
+        """Replace the log with one line per entry, least recently used first. Call under LOCK_EX."""
+        ordered = sorted(entries.items(), key=lambda kv: kv[1][2])
+        with open(f"{self.log_path}.tmp", "w") as f:
+            f.write("".join(f"{key} {offset} {length}\n" for key, (offset, length, _) in ordered))
+        os.replace(f"{self.log_path}.tmp", self.log_path)
+        for position, (_, entry) in enumerate(ordered, 1):
+            entry[2] = position
+        st = os.stat(self.log_path)
+        self.entries, self.log_lines, self.log_ino, self.log_pos = dict(ordered), len(ordered), st.st_ino, st.st_size
+        self.remap()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model name, text hash),
+    with one EmbeddingStore per model under cache_dir.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stores = {}
+
+    def store(self, model_name, sparse):
+        if model_name not in self.stores:
+            path = os.path.join(self.cache_dir, model_slug(model_name))
+            self.stores[model_name] = EmbeddingStore(path, sparse, self.max_bytes)
+        return self.stores[model_name]
+
+    def get_dense(self, model_name, texts):
+        return self.store(model_name, sparse=False).get_many([text_key(t) for t in texts])
+
+    def put_dense(self, model_name, texts, vectors):
+        self.store(model_name, sparse=False).put_many(
+            [(text_key(t), v, None) for t, v in zip(texts, vectors)]
+        )
+
+    def get_sparse(self, model_name, texts):
+        return self.store(model_name, sparse=True).get_many([text_key(t) for t in texts])
+
+    def put_sparse(self, model_name, texts, embeddings):
+        self.store(model_name, sparse=True).put_many(
+            [(text_key(t), values, indices) for t, (indices, values) in zip(texts, embeddings)]
+        )
@@ -0,0 +1,71 @@
+import yaml
+from fastembed import TextEmbedding, SparseTextEmbedding
+from qdrant_client import models
+from embedding_cache import EmbeddingCache
+
+
+def to_sparse_vector(embedding):
+    indices, values = embedding
+    return models.SparseVector(indices=indices.tolist(), values=values.tolist())
+
+
+class EmbeddingEncoder:
+    """
+    Dense + sparse fastembed encoders with the on-disk embedding cache in front.
+    Models are loaded lazily, once per process, and only for cache misses.
+    """
+
+    def __init__(self, dense_model_name, sparse_model_name):
+        config = yaml.safe_load(open("config.yaml"))
+        self.embedding_config = config['embedding']
+        self.dense_model_name = dense_model_name
+        self.sparse_model_name = sparse_model_name
+        self.batch_size = self.embedding_config['batch_size']
+        self.cache = None
+        if self.embedding_config['cache_enabled']:
+            self.cache = EmbeddingCache(self.embedding_config['cache_dir'], self.embedding_config['cache_max_bytes'])
+        self._dense_model = None
+        self._sparse_model = None
+
+    def dense_model(self):
+        if self._dense_model is None:
+            self._dense_model = TextEmbedding(self.dense_model_name)
+        return self._dense_model
+
+    def sparse_model(self):
+        if self._sparse_model is None:
+            self._sparse_model = SparseTextEmbedding(self.sparse_model_name)
+        return self._sparse_model
+
+    def encode_dense(self, texts, cached=True):
+        """float32 dense vectors for texts; cached=False bypasses the embedding cache (e.g. for queries)."""
+        texts = list(texts)
+        cache = self.cache if cached else None
+        vectors = cache.get_dense(self.dense_model_name, texts) if cache else [None] * len(texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            embedded = list(self.dense_model().embed(missing_texts, batch_size=self.batch_size))
+            for i, v in zip(missing, embedded):
+                vectors[i] = v
+            if cache:
+                cache.put_dense(self.dense_model_name, missing_texts, embedded)
+        return vectors
+
+    def encode_sparse(self, texts, cached=True):
+        """(indices, values) sparse vectors for texts; cached as in encode_dense."""
+        texts = list(texts)
+        cache = self.cache if cached else None
+        embeddings = cache.get_sparse(self.sparse_model_name, texts) if cache else [None] * len(texts)
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            embedded = [
+                (e.indices, e.values)
+                for e in self.sparse_model().embed(missing_texts, batch_size=self.batch_size)
+            ]
+            for i, e in zip(missing, embedded):
+                embeddings[i] = e
+            if cache:
+                cache.put_sparse(self.sparse_model_name, missing_texts, embedded)
+        return embeddings
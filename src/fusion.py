@@ -0,0 +1,32 @@
+import heapq
+
+
+def chunk_key(point):
+    """A chunk is the same chunk whichever sub-query returned it."""
+    payload = point["payload"]
+    return payload["pdf_name"], payload["chunk_id"]
+
+
+def fuse_results(result_lists, limit, rrf_k=60):
+    """
+    Reciprocal rank fusion of the per-sub-query result lists (dict(point)s, best
+    first) into one de-duplicated top-`limit` list.
+
+    The per-query scores are already RRF scores of the hybrid search and are not
+    comparable across queries, so only ranks are used: a chunk scores
+    sum(1 / (rrf_k + rank)) over the lists it appears in (rank from 1), which
+    also ranks chunks found by several sub-queries above one-off hits. Each
+    chunk is returned once, as a copy of its first occurrence with the fused
+    score. Ties keep the order of first occurrence.
+    """
+    scores = {}
+    points = {}
+    for results in result_lists:
+        for rank, point in enumerate(results, start=1):
+            key = chunk_key(point)
+            if key not in points:
+                points[key] = point
+                scores[key] = 0.0
+            scores[key] += 1.0 / (rrf_k + rank)
+    top = heapq.nlargest(limit, scores, key=scores.__getitem__)
+    return [dict(points[key], score=scores[key]) for key in top]
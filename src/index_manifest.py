@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import uuid
+
+MANIFEST_VERSION = 3
+
+# Fixed namespace so the same chunk always maps to the same Qdrant point id
+POINT_ID_NAMESPACE = uuid.UUID("6f1c3c1e-5d0a-4b8e-9a47-2f0b7e3d9c11")
+
+
+def file_sha256(path):
+    """Hash a file on disk in 1MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def row_hash(row):
+    """Hash of everything stored in a point's payload, so owner changes are re-upserted too."""
+    return chunk_hash(json.dumps(row, sort_keys=True, default=str))
+
+
+def point_entry(row):
+    """Manifest record of an uploaded row: [pdf_name, user_id (the tenant it was routed to), row_hash]."""
+    return [row["pdf_name"], row["user_id"], row_hash(row)]
+
+
+def point_id(pdf_name, page, chunk_id, text):
+    """Deterministic point id derived from the chunk location and its content."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{pdf_name}/{page}/{chunk_id}/{chunk_hash(text)}"))
+
+
+class IndexManifest:
+    """
+    JSON manifest of what has been indexed.
+
+    pdfs:   {pdf_name: {"sha256": ..., "user_id": ..., "chunking": ...}}  written by EarningCallIndexer
+    points: {point_id: [pdf_name, user_id, row_hash]}     written by QuadrantIndexer
+
+    Older manifests are migrated on load (see migrate_points) and saved as MANIFEST_VERSION.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pdfs = {}
+        self.points = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            version = data.get("version", 1)
+            if version > MANIFEST_VERSION:
+                raise ValueError(f"{path} has manifest version {version}, this code reads up to {MANIFEST_VERSION}")
+            self.pdfs = data.get("pdfs", {})
+            self.points = self.migrate_points(version, data.get("points", {}))
+
+    def migrate_points(self, version, points):
+        """
+        Version 1 stored {point_id: row_hash} without the pdf. Those points get pdf and
+        tenant None: their hash never matches, so they are all re-upserted once, and the
+        ones no longer in the corpus are found and deleted as stale.
+        Version 2 stored [pdf_name, row_hash]; the tenant is taken from the pdf's entry.
+        """
+        migrated = {}
+        for pid, entry in points.items():
+            if not isinstance(entry, list):
+                entry = [None, entry]
+            if len(entry) == 2:
+                pdf_name, h = entry
+                entry = [pdf_name, self.pdfs.get(pdf_name, {}).get("user_id"), h]
+            migrated[pid] = entry
+        return migrated
+
+    def pdf_unchanged(self, pdf_name, pdf_hash, user_id, chunking):
+        """True if the pdf file, its owner and the chunking settings are the same as last time."""
+        entry = self.pdfs.get(pdf_name)
+        return entry == {"sha256": pdf_hash, "user_id": user_id, "chunking": chunking}
+
+    def set_pdf(self, pdf_name, pdf_hash, user_id, chunking):
+        self.pdfs[pdf_name] = {"sha256": pdf_hash, "user_id": user_id, "chunking": chunking}
+
+    def invalidate_pdf(self, pdf_name):
+        """Drop the pdf's recorded hash (keeping its owner), so the next run extracts it again."""
+        if pdf_name in self.pdfs:
+            self.pdfs[pdf_name]["sha256"] = None
+
+    def retain_pdfs(self, pdf_names):
+        """Forget PDFs that are no longer in pdf_mapping."""
+        self.pdfs = {k: v for k, v in self.pdfs.items() if k in pdf_names}
+
+    def diff_points(self, current):
+        """
+        Compare {point_id: point_entry(row)} of the current corpus against what was uploaded.
+        Returns (ids to upsert, ids to delete).
+        """
+        to_upsert = [pid for pid, h in current.items() if self.points.get(pid) != h]
+        stale = [pid for pid in self.points if pid not in current]
+        return to_upsert, stale
+
+    def point_ids_for(self, pdf_names):
+        """Uploaded point ids that belong to any of pdf_names."""
+        return {pid for pid, (pdf_name, _, _) in self.points.items() if pdf_name in pdf_names}
+
+    def tenants_for(self, point_ids, fallback=()):
+        """
+        Tenants the point ids were uploaded for, so they can be deleted even if the tenant
+        has since left pdf_mapping. If any of them predates tenant tracking, every tenant
+        this manifest knows of, plus fallback.
+        """
+        tenants = {self.points[pid][1] for pid in point_ids if pid in self.points}
+        if None in tenants:
+            tenants = {entry[1] for entry in self.points.values()} | {p["user_id"] for p in self.pdfs.values()} | set(fallback)
+            tenants.discard(None)
+        return tenants
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "pdfs": self.pdfs, "points": self.points}, f)
+        os.replace(tmp_path, self.path)
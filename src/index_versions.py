@@ -0,0 +1,48 @@
+import json
+import os
+
+
+class IndexVersions:
+    """
+    Per-tenant index version file ({user_id: version}).
+
+    The indexers bump a tenant's version after every run that upserted or deleted
+    that tenant's points; the API keys its retrieval result cache on the version,
+    so a re-index invalidates exactly the tenants it touched. Readers re-load the
+    file only when it has been replaced.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.versions = {}
+        self.signature = None
+
+    def refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self.versions, self.signature = {}, None
+            return
+        # Writers replace the file, so the inode changes even if mtime resolution is coarse
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if signature != self.signature:
+            with open(self.path) as f:
+                self.versions = json.load(f)
+            self.signature = signature
+
+    def version(self, user_id):
+        self.refresh()
+        return self.versions.get(user_id, 0)
+
+    def bump(self, user_ids):
+        if not user_ids:
+            return
+        self.refresh()
+        for user_id in user_ids:
+            self.versions[user_id] = self.versions.get(user_id, 0) + 1
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.versions, f, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.signature = None
+        print(f"index version bumped for {sorted(user_ids)}")
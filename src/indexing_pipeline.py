@@ -0,0 +1,246 @@
+import argparse, queue, threading, time
+import yaml
+from data_indexing import EarningCallIndexer, QuadrantIndexer
+from index_manifest import IndexManifest, file_sha256, point_entry, point_id
+from chunk_store import iter_chunk_rows, open_chunk_writer
+
+_DONE = object()
+
+
+class StreamingIndexPipeline:
+    """
+    Streaming extract -> chunk -> embed/upload pipeline.
+
+    Extraction and chunking run in their own threads and hand work on through
+    bounded queues; QuadrantIndexer.bulk_load consumes the chunk stream with a
+    bounded number of batches in flight, so peak memory depends on queue_size
+    and the batch size rather than on corpus size. The chunk output (csv or chunk store) is an optional side output.
+
+    With upload=False (--no-upload) nothing is sent to Qdrant: the chunks are only
+    embedded into the embedding cache and written to the chunk output, which is
+    what the numpy retrieval backend loads. Such a run always re-chunks every pdf
+    and leaves the manifest, which tracks the Qdrant points, untouched.
+    """
+
+    def __init__(self, upload=True):
+        config = yaml.safe_load(open("config.yaml"))
+        pipeline_config = config['indexing']['pipeline']
+        self.queue_size = pipeline_config['queue_size']
+        self.upload = upload
+        self.write_chunks = pipeline_config['write_chunks'] or not upload
+        if not upload and not config['embedding']['cache_enabled']:
+            raise ValueError("--no-upload fills the embedding cache; set embedding.cache_enabled")
+        self.pdf_indexer = EarningCallIndexer()
+        self.qdrant_indexer = QuadrantIndexer()
+        self.pdf_mapping = self.pdf_indexer.pdf_mapping
+        self.incremental = self.pdf_indexer.incremental and upload
+        self.stop = threading.Event()
+        self.errors = []
+
+    def put(self, q, item):
+        """Blocking put that gives up once another stage has failed."""
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q):
+        """Blocking get that returns _DONE once another stage has failed."""
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def run_stage(self, target, *args):
+        def wrapper():
+            try:
+                target(*args)
+            except BaseException as e:
+                self.errors.append(e)
+                self.stop.set()
+        thread = threading.Thread(target=wrapper, daemon=True)
+        thread.start()
+        return thread
+
+    def extract_stage(self, pdf_names, page_queue):
+        try:
+            for item in self.pdf_indexer.iter_pages(pdf_names):
+                if not self.put(page_queue, item):
+                    return
+        finally:
+            self.put(page_queue, _DONE)
+
+    def chunk_stage(self, page_queue, row_queue, skipped_pdfs):
+        writer = None
+        completed = False
+        try:
+            if self.write_chunks:
+                writer = self.open_writer(skipped_pdfs)
+            for row in self.iter_rows(page_queue):
+                if writer is not None:
+                    writer.write(row)
+                if not self.put(row_queue, row):
+                    return
+            completed = True
+        finally:
+            if writer is not None:
+                # Only a complete chunk output replaces the previous one; otherwise drop the .tmp
+                if completed and not self.stop.is_set():
+                    writer.close()
+                else:
+                    writer.abort()
+            self.put(row_queue, _DONE)
+
+    def iter_rows(self, page_queue):
+        """
+        Chunk rows for the pages coming off page_queue. Cross-page chunking buffers
+        one pdf at a time (pages arrive grouped by pdf); otherwise pages are chunked
+        as they arrive.
+        """
+        indexer = self.pdf_indexer
+        chunk_ids = {}
+        buffered_pdf, buffered_pages = None, []
+        while True:
+            item = self.get(page_queue)
+            if item is _DONE or (indexer.cross_page and buffered_pdf is not None and item[0] != buffered_pdf):
+                if buffered_pages:
+                    yield from indexer.chunk_pdf(buffered_pdf, self.pdf_mapping[buffered_pdf], buffered_pages)
+                buffered_pdf, buffered_pages = None, []
+            if item is _DONE:
+                return
+            pdf_name, page_idx, text = item
+            if indexer.cross_page:
+                buffered_pdf = pdf_name
+                buffered_pages.append((page_idx, text))
+                continue
+            rows = indexer.chunk_page(pdf_name, self.pdf_mapping[pdf_name], page_idx, text, chunk_ids.get(pdf_name, 0))
+            chunk_ids[pdf_name] = chunk_ids.get(pdf_name, 0) + len(rows)
+            yield from rows
+
+    def open_writer(self, skipped_pdfs):
+        """
+        Chunk output writer, pre-filled with the previous rows of skipped pdfs so it stays
+        complete. They are copied row by row from the previous output, which is only
+        replaced when the new one is closed.
+        """
+        indexer = self.pdf_indexer
+        writer = open_chunk_writer(indexer.chunk_format, indexer.filename, indexer.chunk_store_path)
+        try:
+            if skipped_pdfs:
+                for row in iter_chunk_rows(indexer.chunk_format, indexer.filename, indexer.chunk_store_path, skipped_pdfs):
+                    writer.write(row)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer
+
+    def unchanged_pdfs(self, manifest):
+        """PDFs whose file hash and owner match the manifest and that already have uploaded points."""
+        unchanged = set()
+        for k, v in self.pdf_mapping.items():
+            signature = self.pdf_indexer.chunking_signature
+            if manifest.pdf_unchanged(k, file_sha256(f"dataset/{k}.pdf"), v, signature) and manifest.point_ids_for({k}):
+                unchanged.add(k)
+        return unchanged
+
+    def drop_moved_pdfs(self, client, manifest, pdf_names):
+        """Delete the old copies of pdfs whose owner changed; they are re-upserted under the new tenant."""
+        for k in pdf_names:
+            previous_owner = manifest.pdfs.get(k, {}).get("user_id")
+            if previous_owner is None or previous_owner == self.pdf_mapping[k]:
+                continue
+            moved = manifest.point_ids_for({k})
+            if moved:
+                self.qdrant_indexer.delete_points(client, moved, manifest.tenants_for(moved, [previous_owner]))
+                for pid in moved:
+                    manifest.points.pop(pid)
+            print(f"{k} moved from {previous_owner} to {self.pdf_mapping[k]}, {len(moved)} old points deleted")
+
+    def run(self, client):
+        manifest = IndexManifest(self.pdf_indexer.manifest_path) if self.incremental else None
+        skipped = self.unchanged_pdfs(manifest) if manifest is not None else set()
+        pdf_names = [k for k in self.pdf_mapping if k not in skipped]
+        print(f"streaming {len(pdf_names)} pdfs, skipping {len(skipped)} unchanged")
+
+        if manifest is not None:
+            self.drop_moved_pdfs(client, manifest, pdf_names)
+
+        page_queue = queue.Queue(maxsize=self.queue_size)
+        row_queue = queue.Queue(maxsize=self.queue_size)
+        stages = [
+            self.run_stage(self.extract_stage, pdf_names, page_queue),
+            self.run_stage(self.chunk_stage, page_queue, row_queue, skipped),
+        ]
+
+        start_time = time.perf_counter()
+        current = {}
+
+        def pending_points():
+            """Rows off the chunk stage that are new or changed since the last run."""
+            while True:
+                row = self.get(row_queue)
+                if row is _DONE:
+                    return
+                pid = point_id(row["pdf_name"], row["page"], row["chunk_id"], str(row["text"]))
+                current[pid] = point_entry(row)
+                if manifest is None or manifest.points.get(pid) != current[pid]:
+                    yield pid, row
+
+        try:
+            n_upserted = self.qdrant_indexer.bulk_load(client, pending_points())
+        except BaseException:
+            self.stop.set()
+            raise
+        finally:
+            for stage in stages:
+                stage.join()
+        if self.errors:
+            raise self.errors[0]
+
+        elapsed = time.perf_counter() - start_time
+        print(f"streamed {len(current)} chunks, upserted {n_upserted} in {elapsed:.2f}s "
+              f"({len(current) / max(elapsed, 1e-9):.1f} chunks/sec)")
+
+        if manifest is not None:
+            # Points of a pdf with unread pages are kept (their pages may be the missing ones)
+            # and the pdf isn't recorded as indexed, so the next run extracts it again
+            failed = self.pdf_indexer.failed_pdfs
+            if failed:
+                print(f"incremental: {sorted(failed)} had unreadable pages, they will be retried")
+            processed = set(pdf_names) - failed | {k for k, _, _ in manifest.points.values() if k not in self.pdf_mapping}
+            stale = list(manifest.point_ids_for(processed) - current.keys())
+            if stale:
+                self.qdrant_indexer.delete_points(client, stale, manifest.tenants_for(stale, self.qdrant_indexer.tenants))
+            print(f"incremental: {len(stale)} stale chunks deleted")
+            for pid in stale:
+                manifest.points.pop(pid)
+            manifest.points.update(current)
+            for k in pdf_names:
+                if k in failed:
+                    manifest.invalidate_pdf(k)
+                else:
+                    manifest.set_pdf(k, file_sha256(f"dataset/{k}.pdf"), self.pdf_mapping[k], self.pdf_indexer.chunking_signature)
+            manifest.retain_pdfs(self.pdf_mapping)
+            manifest.save()
+        self.qdrant_indexer.publish_index_versions()
+
+    def process(self):
+        if not self.upload:
+            self.run(None)
+            return
+        client = self.qdrant_indexer.get_client()
+        self.qdrant_indexer.create_index(client)
+        self.run(client)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming extract -> chunk -> embed -> upload indexing.")
+    parser.add_argument("--no-upload", action="store_true",
+                        help="only fill the embedding cache and the chunk output (numpy backend, no Qdrant server)")
+    args = parser.parse_args()
+    StreamingIndexPipeline(upload=not args.no_upload).process()
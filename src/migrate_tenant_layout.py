@@ -0,0 +1,82 @@
+"""
+Copy indexed points from one tenant layout to another (see tenant_routing.py).
+
+    python migrate_tenant_layout.py --from shared --to collection
+    python migrate_tenant_layout.py --from shared --to shard_key --delete-source
+
+Vectors and payloads are copied as stored, nothing is re-embedded. Point ids are
+kept, so re-running the migration is safe. Set indexing.tenant_layout to the new
+layout afterwards so the indexer and the retriever follow. The index version of
+every migrated tenant is bumped, so cached retrievals from before are not served.
+"""
+import argparse, time
+from qdrant_client import models
+from data_indexing import QuadrantIndexer
+from tenant_routing import LAYOUTS, TenantRouter
+
+
+def iter_points(client, router, tenants, batch_size):
+    for collection_name, shard_keys in router.targets(tenants):
+        if not client.collection_exists(collection_name):
+            continue
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+                shard_key_selector=shard_keys,
+            )
+            yield points
+            if offset is None:
+                break
+
+
+def copy_points(client, router, points):
+    """Upsert points into the layout of router; returns the tenants they belong to."""
+    points_by_tenant = {}
+    for point in points:
+        points_by_tenant.setdefault(point.payload["user_id"], []).append(
+            models.PointStruct(id=point.id, vector=point.vector, payload=point.payload)
+        )
+    for user_id, tenant_points in points_by_tenant.items():
+        route = router.route(user_id)
+        client.upsert(collection_name=route.collection_name, points=tenant_points, shard_key_selector=route.shard_key)
+    return set(points_by_tenant)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from", dest="source", choices=LAYOUTS, required=True)
+    parser.add_argument("--to", dest="target", choices=LAYOUTS, required=True)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--delete-source", action="store_true", help="drop the source collection(s) after copying")
+    args = parser.parse_args()
+    if args.source == args.target:
+        parser.error("--from and --to must be different layouts")
+
+    indexer = QuadrantIndexer()
+    source, target = TenantRouter(args.source), TenantRouter(args.target)
+    client = indexer.get_client()
+    indexer.router = target
+    indexer.create_index(client)
+
+    start_time = time.perf_counter()
+    n_points = 0
+    for points in iter_points(client, source, indexer.tenants, args.batch_size):
+        indexer.dirty_tenants.update(copy_points(client, target, points))
+        n_points += len(points)
+        print(f"copied {n_points} points")
+    print(f"migrated {n_points} points from {args.source} to {args.target} in {time.perf_counter() - start_time:.2f}s")
+
+    if args.delete_source:
+        for collection_name, _ in source.targets(indexer.tenants):
+            client.delete_collection(collection_name)
+            print(f"Deleted collection--{collection_name}")
+    indexer.publish_index_versions()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import asyncio, os
+import numpy as np
+import yaml
+from qdrant_client import models
+from chunk_store import iter_chunk_rows
+from index_manifest import point_id
+from retrieval import QuadrantRetrieval
+
+
+class NumpyHybridIndex:
+    """
+    In-memory hybrid index over the chunk output of the indexer.
+
+    Rows are sorted by user_id so each tenant owns one contiguous row range
+    (tenant_ranges); tenant-scoped dense scoring is then a single matrix product
+    over a view, with no copy and no per-row filtering.
+
+      dense   float32 (n_rows, dim) matrix of L2-normalized vectors (cosine, like the collection)
+      sparse  inverted index: postings sorted by term id, with the row id and weight of each posting
+    """
+
+    def __init__(self, rows, dense_vectors, sparse_vectors):
+        order = sorted(range(len(rows)), key=lambda i: rows[i]["user_id"])
+        self.rows = [rows[i] for i in order]
+        self.ids = [point_id(r["pdf_name"], r["page"], r["chunk_id"], str(r["text"])) for r in self.rows]
+
+        self.tenant_ranges = {}
+        for i, row in enumerate(self.rows):
+            start, _ = self.tenant_ranges.get(row["user_id"], (i, i))
+            self.tenant_ranges[row["user_id"]] = (start, i + 1)
+
+        if not rows:
+            # Nothing indexed yet: every tenant range is empty and score_batch returns no points
+            self.dense = np.zeros((0, 0), dtype=np.float32)
+        else:
+            dense = np.asarray([dense_vectors[i] for i in order], dtype=np.float32).reshape(len(order), -1)
+            norms = np.linalg.norm(dense, axis=1, keepdims=True)
+            self.dense = np.ascontiguousarray(dense / np.maximum(norms, 1e-12))
+
+        sparse = [sparse_vectors[i] for i in order]
+        lengths = [len(indices) for indices, _ in sparse]
+        terms = np.concatenate([np.asarray(indices, dtype=np.int64) for indices, _ in sparse]) if sparse else np.zeros(0, np.int64)
+        weights = np.concatenate([np.asarray(values, dtype=np.float32) for _, values in sparse]) if sparse else np.zeros(0, np.float32)
+        row_ids = np.repeat(np.arange(len(sparse), dtype=np.int32), lengths)
+        by_term = np.argsort(terms, kind="stable")
+        self.posting_terms = terms[by_term]
+        self.posting_rows = row_ids[by_term]
+        self.posting_weights = weights[by_term]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def sparse_scores(self, indices, values, start, stop):
+        """Dot products of one sparse query with rows [start, stop); 0 where no term is shared."""
+        lo = np.searchsorted(self.posting_terms, indices, side="left")
+        hi = np.searchsorted(self.posting_terms, indices, side="right")
+        postings = [np.arange(a, b) for a, b in zip(lo, hi) if b > a]
+        if not postings:
+            return np.zeros(stop - start, dtype=np.float32), np.zeros(stop - start, dtype=bool)
+        counts = (hi - lo)[hi > lo]
+        postings = np.concatenate(postings)
+        query_weights = np.repeat(np.asarray(values, dtype=np.float32)[hi > lo], counts)
+        rows = self.posting_rows[postings]
+        keep = (rows >= start) & (rows < stop)
+        rows = rows[keep] - start
+        scores = np.bincount(rows, weights=self.posting_weights[postings][keep] * query_weights[keep], minlength=stop - start)
+        matched = np.bincount(rows, minlength=stop - start) > 0
+        return scores.astype(np.float32), matched
+
+
+def top_k(scores, k, candidates=None):
+    """Indices of the k highest scores (optionally only among candidates), best first."""
+    idx = np.flatnonzero(candidates) if candidates is not None else np.arange(len(scores))
+    if len(idx) > k:
+        idx = idx[np.argpartition(-scores[idx], k - 1)[:k]]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def rrf(rankings, k, limit):
+    """Reciprocal rank fusion with Qdrant's scoring, 1 / (rank + k) with rank from 0."""
+    fused = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking):
+            fused[int(i)] = fused.get(int(i), 0.0) + 1.0 / (rank + k)
+    return sorted(fused.items(), key=lambda item: -item[1])[:limit]
+
+
+class NumpyRetrieval(QuadrantRetrieval):
+    """
+    Qdrant-free retrieval backend (retrival.backend: "numpy") for edge deployments,
+    CI and load tests. Same interface and result shape as QuadrantRetrieval: the
+    query / result caches and encode_queries are inherited, only the search itself
+    runs against a NumpyHybridIndex built from the chunk output.
+
+    Chunk vectors are read from the embedding cache filled by the indexer. If some
+    are missing, loading fails (the index would otherwise re-encode the corpus on
+    the API's start-up path) unless retrival.numpy.encode_missing is set. The index
+    is rebuilt when the chunk output is replaced.
+    """
+
+    def __init__(self):
+        super().__init__()
+        config = yaml.safe_load(open("config.yaml"))
+        self.chunk_format = config['chunk_format']
+        self.chunk_store_path = config['chunk_store_path']
+        numpy_config = self.retrival_config['numpy']
+        self.prefetch_limit = numpy_config['prefetch_limit']
+        self.rrf_k = numpy_config['rrf_k']
+        self.encode_missing = numpy_config['encode_missing']
+        self.index = None
+        self.index_signature = None
+        self.load_task = None
+
+    def chunk_source_signature(self):
+        path = os.path.join(self.chunk_store_path, "rows.npy") if self.chunk_format == "store" else self.filename
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load_index(self):
+        rows = list(iter_chunk_rows(self.chunk_format, self.filename, self.chunk_store_path))
+        texts = [str(row["text"]) for row in rows]
+        dense, sparse = self.cached_chunk_vectors(texts)
+        index = NumpyHybridIndex(rows, dense, sparse)
+        print(f"numpy index loaded--{len(index)} chunks, {len(index.tenant_ranges)} tenants")
+        return index
+
+    def cached_chunk_vectors(self, texts):
+        """Dense and sparse chunk vectors from the embedding cache; see encode_missing."""
+        cache = self.encoder.cache
+        dense = cache.get_dense(self.encoder.dense_model_name, texts) if cache else [None] * len(texts)
+        sparse = cache.get_sparse(self.encoder.sparse_model_name, texts) if cache else [None] * len(texts)
+        missing = sum(d is None or s is None for d, s in zip(dense, sparse))
+        if not missing:
+            return dense, sparse
+        message = f"numpy index: {missing} of {len(texts)} chunks have no cached embeddings"
+        if not self.encode_missing:
+            raise RuntimeError(f"{message}; run the indexer with embedding.cache_enabled, or set retrival.numpy.encode_missing")
+        print(f"warning: {message}, encoding them now")
+        return self.encoder.encode_dense(texts), self.encoder.encode_sparse(texts)
+
+    async def get_client(self):
+        """
+        The loaded index stands in for the Qdrant client; (re)built when the chunk output
+        changes. Concurrent callers wait on one load, which carries on if a caller is
+        cancelled (e.g. a timed-out readiness check).
+        """
+        signature = self.chunk_source_signature()
+        if self.index is None or signature != self.index_signature:
+            if self.load_task is None or self.load_task.done():
+                self.load_task = asyncio.ensure_future(self.reload_index(signature))
+            await asyncio.shield(self.load_task)
+        return self.index
+
+    async def reload_index(self, signature):
+        self.index = await asyncio.to_thread(self.load_index)
+        self.index_signature = signature
+        if self.result_cache is not None:
+            self.result_cache.entries.clear()
+
+    async def ping(self):
+        """Ready once an index is loaded; reloads are left to get_client."""
+        if self.index is None:
+            raise RuntimeError("numpy index is not loaded")
+
+    async def close_client(self):
+        if self.load_task is not None:
+            self.load_task.cancel()
+        self.load_task = None
+        self.index = None
+        self.index_signature = None
+
+    def score_batch(self, index, texts, user_id):
+        start, stop = index.tenant_ranges.get(user_id, (0, 0))
+        if start == stop:
+            return [[] for _ in texts]
+        dense_vectors, sparse_vectors = self.encode_queries(texts)
+        limit = self.retrival_config['topn']
+        prefetch_limit = max(self.prefetch_limit, limit)
+        queries = np.asarray(dense_vectors, dtype=np.float32).reshape(len(texts), -1)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        # One matrix product scores every query against the tenant's rows
+        dense_scores = queries @ index.dense[start:stop].T
+        results = []
+        for q, sparse_vector in enumerate(sparse_vectors):
+            sparse_scores, matched = index.sparse_scores(
+                np.asarray(sparse_vector.indices), np.asarray(sparse_vector.values), start, stop
+            )
+            fused = rrf(
+                [top_k(dense_scores[q], prefetch_limit), top_k(sparse_scores, prefetch_limit, matched)],
+                self.rrf_k,
+                limit,
+            )
+            results.append([
+                dict(models.ScoredPoint(
+                    id=index.ids[start + i],
+                    version=0,
+                    score=score,
+                    payload=dict(index.rows[start + i]),
+                ))
+                for i, score in fused
+            ])
+        return results
+
+    async def search(self, text, route):
+        results = await self.search_batch([text], route)
+        return results[0]
+
+    async def search_batch(self, texts, route):
+        if not texts:
+            return []
+        index = await self.get_client()
+        return await asyncio.to_thread(self.score_batch, index, texts, route.user_id)
@@ -0,0 +1,41 @@
+class PromptAssembler:
+    """
+    Builds chat prompts in the order vLLM's automatic prefix caching can reuse:
+
+      prefix   the stage's system prompt (with its few-shot examples), byte-identical
+               for every user and turn, so its KV blocks are shared by all requests
+      history  the user's stored turns, append-only between trims (see
+               AsyncConversationStore), so it is reused across that user's turns
+      turn     the new user message with the retrieved context, the only part that
+               changes every turn, always last
+
+    Each prompt's token count per segment is returned, and running totals per
+    stage are kept in metrics.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.prefix_tokens = {}  # system prompt -> token count, they never change
+        self.metrics = {}
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.offsets(text))
+
+    def build(self, stage, system_prompt, history, user_content):
+        """(messages, {"prefix": n, "history": n, "turn": n}) for one LLM call."""
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.extend(history)
+        messages.append({"role": "user", "content": user_content})
+
+        if system_prompt not in self.prefix_tokens:
+            self.prefix_tokens[system_prompt] = self.count_tokens(system_prompt)
+        token_counts = {
+            "prefix": self.prefix_tokens[system_prompt],
+            "history": sum(self.count_tokens(m["content"]) for m in history),
+            "turn": self.count_tokens(user_content),
+        }
+        totals = self.metrics.setdefault(stage, {"prompts": 0, "prefix": 0, "history": 0, "turn": 0})
+        totals["prompts"] += 1
+        for segment, n in token_counts.items():
+            totals[segment] += n
+        return messages, token_counts
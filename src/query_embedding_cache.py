@@ -0,0 +1,120 @@
+import re, threading, time
+from collections import OrderedDict
+import numpy as np
+import redis
+from embedding_cache import text_key
+
+
+def normalize_query(text):
+    """Case- and whitespace-insensitive form of a query, so "Q3  revenue" and "q3 revenue" share vectors."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def encode_value(value, sparse):
+    if sparse:
+        indices, values = value
+        n = np.int32(len(indices)).tobytes()
+        return n + np.asarray(indices, dtype=np.int32).tobytes() + np.asarray(values, dtype=np.float32).tobytes()
+    return np.asarray(value, dtype=np.float32).tobytes()
+
+
+def decode_value(data, sparse):
+    if sparse:
+        n = int(np.frombuffer(data[:4], dtype=np.int32)[0])
+        indices = np.frombuffer(data, dtype=np.int32, count=n, offset=4)
+        values = np.frombuffer(data, dtype=np.float32, count=n, offset=4 + 4 * n)
+        return indices, values
+    return np.frombuffer(data, dtype=np.float32)
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query vectors with a TTL, keyed by (model name, normalized
+    query). Sits in front of EmbeddingEncoder on the retrieval path so repeated
+    sub-queries skip the models entirely.
+
+    With a Redis backend, vectors are also shared between API processes: local
+    misses are looked up in Redis before encoding, and new vectors are written
+    to both. Redis errors are counted and otherwise ignored.
+    """
+
+    def __init__(self, max_entries, ttl_seconds, redis_config=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()  # encoding runs in worker threads
+        self.redis = None
+        if redis_config and redis_config['enabled']:
+            self.redis = redis.Redis(host=redis_config['host'], port=redis_config['port'], db=redis_config['db'])
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    def key(self, model_name, text):
+        return f"qemb:{model_name}:{text_key(normalize_query(text))}"
+
+    def get_many(self, model_name, texts, sparse):
+        keys = [self.key(model_name, t) for t in texts]
+        values = [None] * len(texts)
+        now = time.monotonic()
+        with self.lock:
+            for i, key in enumerate(keys):
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                expires_at, value = entry
+                if expires_at < now:
+                    del self.entries[key]
+                    continue
+                self.entries.move_to_end(key)
+                values[i] = value
+            missing = [i for i, v in enumerate(values) if v is None]
+            self.hits += len(texts) - len(missing)
+        if missing and self.redis is not None:
+            try:
+                stored = self.redis.mget([keys[i] for i in missing])
+            except redis.RedisError:
+                self.redis_errors += 1
+                stored = [None] * len(missing)
+            found = {}
+            for i, data in zip(missing, stored):
+                if data is not None:
+                    values[i] = found[keys[i]] = decode_value(data, sparse)
+            self.put_local(found)
+        with self.lock:
+            self.redis_hits += len(missing) - sum(v is None for v in values)
+            self.misses += sum(v is None for v in values)
+        return values
+
+    def put_many(self, model_name, texts, values, sparse):
+        items = {self.key(model_name, t): v for t, v in zip(texts, values)}
+        self.put_local(items)
+        if self.redis is not None and items:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key, value in items.items():
+                    pipe.set(key, encode_value(value, sparse), ex=self.ttl_seconds)
+                pipe.execute()
+            except redis.RedisError:
+                self.redis_errors += 1
+
+    def put_local(self, items):
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self.lock:
+            for key, value in items.items():
+                self.entries[key] = (expires_at, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.redis_hits) / lookups, 3) if lookups else 0.0,
+            "redis_errors": self.redis_errors,
+        }
@@ -0,0 +1,101 @@
+import asyncio, time
+import yaml
+
+
+class ReadinessChecks:
+    """
+    Start-up warm-up and per-dependency readiness for the API process.
+
+    warm_up() runs in the background while the app already serves /ready. It loads
+    the query encoders (with one dummy inference) and opens the retrieval client
+    (for the numpy backend, the index load) and the OpenAI client, each in a task
+    that outlives its check's timeout, then checks the Qdrant, Redis and vLLM
+    connections. A load still running is reported as "loading". refresh()
+    re-checks the connections and the loads that aren't done, without waiting for
+    a load longer than readiness.timeout; the /ready endpoint calls it so an
+    instance turns ready as soon as its dependencies come up.
+    """
+
+    def __init__(self, ec, redis_store):
+        config = yaml.safe_load(open("config.yaml"))
+        self.readiness_config = config['readiness']
+        self.ec = ec
+        self.redis_store = redis_store
+        self.loads = {
+            "encoders": lambda: asyncio.to_thread(self.ec.qd.warm_up),
+            "clients": self.open_clients,
+        }
+        self.status = {name: {"ready": False, "state": "loading"} for name in self.loads}
+        self.status.update({name: {"ready": False, "state": "pending"} for name in ("qdrant", "redis", "llm")})
+        self.tasks = {}
+
+    async def open_clients(self):
+        # One pooled Qdrant client (or the numpy index) and one OpenAI client for the whole process
+        await self.ec.qd.get_client()
+        await self.ec.get_client()
+
+    async def check(self, name, check_fn, timeout):
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(check_fn(), timeout)
+            self.status[name] = {"ready": True, "state": "ready", "ms": round((time.perf_counter() - start_time) * 1000, 1)}
+        except asyncio.TimeoutError:
+            task = self.tasks.get(name)
+            if task is not None and not task.done():
+                self.status[name] = {"ready": False, "state": "loading"}
+            else:
+                self.status[name] = {"ready": False, "state": "error", "error": f"timed out after {timeout}s"}
+        except Exception as e:
+            self.status[name] = {"ready": False, "state": "error", "error": f"{type(e).__name__}: {e}"}
+        return self.status[name]["ready"]
+
+    async def check_load(self, name, timeout):
+        """
+        Check of one of self.loads. A timed-out check leaves the load running; later
+        checks wait on it instead of starting another, and a failed load is retried.
+        """
+        async def wait_for_load():
+            task = self.tasks.get(name)
+            if task is None or (task.done() and task.exception() is not None):
+                task = self.tasks[name] = asyncio.ensure_future(self.loads[name]())
+            await asyncio.shield(task)
+        return await self.check(name, wait_for_load, timeout)
+
+    async def check_connections(self):
+        timeout = self.readiness_config['timeout']
+        await asyncio.gather(
+            self.check("qdrant", self.ec.qd.ping, timeout),
+            self.check("redis", self.redis_store.redis.ping, timeout),
+            self.check("llm", self.ec.ping_llm, timeout),
+        )
+
+    async def check_clients_and_connections(self, timeout):
+        # The connections are checked once the clients are open (and the numpy index loaded)
+        if self.status["clients"]["ready"] or await self.check_load("clients", timeout):
+            await self.check_connections()
+
+    async def warm_up(self):
+        start_time = time.perf_counter()
+        model_timeout = self.readiness_config['model_timeout']
+        await asyncio.gather(
+            self.check_load("encoders", model_timeout),
+            self.check_clients_and_connections(model_timeout),
+        )
+        print(f"warm-up done in {time.perf_counter() - start_time:.2f}s--", self.status)
+
+    async def refresh(self):
+        timeout = self.readiness_config['timeout']
+        checks = [self.check_clients_and_connections(timeout)]
+        if not self.status["encoders"]["ready"]:
+            checks.append(self.check_load("encoders", timeout))
+        await asyncio.gather(*checks)
+
+    def ready(self):
+        return all(s["ready"] for s in self.status.values())
+
+    def report(self):
+        return {"ready": self.ready(), "dependencies": self.status}
+
+    async def close(self):
+        for task in self.tasks.values():
+            task.cancel()
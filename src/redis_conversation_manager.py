@@ -3,9 +3,12 @@ import asyncio
 import json
 
 class AsyncConversationStore:
-    def __init__(self, host="localhost", port=6379, db=0, limit=10):
+    def __init__(self, host="localhost", port=6379, db=0, limit=10, trim_to=None):
         self.redis = aioredis.Redis(host=host, port=port, db=db, decode_responses=True)
         self.limit = limit
+        # Trim in steps instead of sliding one message per turn: what is left stays a
+        # byte-identical prompt prefix for several turns (vLLM prefix caching)
+        self.trim_to = trim_to if trim_to is not None else limit // 2
 
     async def load(self, user_id: str):
         data = await self.redis.get(user_id)
@@ -13,7 +16,11 @@ class AsyncConversationStore:
 
     async def save(self, user_id: str, conversation):
         if len(conversation) > self.limit:
-            conversation = conversation[-self.limit:]
+            start = len(conversation) - self.trim_to
+            # keep whole turns, starting at a user message
+            while start < len(conversation) and conversation[start].get("role") != "user":
+                start += 1
+            conversation = conversation[start:]
         await self.redis.set(user_id, json.dumps(conversation))
 
     async def append(self, user_id: str, role: str, content: str):
@@ -21,6 +28,12 @@ class AsyncConversationStore:
         convo.append({"role": role, "content": content})
         await self.save(user_id, convo)
 
+    async def extend(self, user_id: str, messages):
+        """Append several messages (a whole turn) with one read and one write."""
+        convo = await self.load(user_id)
+        convo.extend(messages)
+        await self.save(user_id, convo)
+
     async def delete(self, user_id: str):
         await self.redis.delete(user_id)
 
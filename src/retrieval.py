@@ -1,43 +1,133 @@
 from qdrant_client import AsyncQdrantClient, models
 import yaml
 import asyncio
+from functools import partial
+import httpx
+from embedding_encoder import EmbeddingEncoder, to_sparse_vector
+from tenant_routing import TenantRouter
+from query_embedding_cache import QueryEmbeddingCache
+from retrieval_cache import RetrievalResultCache
+from index_versions import IndexVersions
 
 class QuadrantRetrieval:
     def __init__(self):
         config = yaml.safe_load(open("config.yaml"))
         self.host = config['indexing']['quadrant_host']
         self.port =  config['indexing']['quadrant_port']
-        self.collection_name = config['indexing']['collection_name']
+        self.router = TenantRouter()
         self.retrival_config = config['retrival']
+        self.client_config = self.retrival_config['client']
+        self.quantization_config = config['indexing']['collection']['quantization']
         self.filename = config['filename']
         self.dense_model_name = "sentence-transformers/all-MiniLM-L6-v2"
         self.sparse_model_name = "prithivida/Splade_PP_en_v1"
         self.dense_vector_name = "dense"
         self.sparse_vector_name = "sparse"
+        self.encoder = EmbeddingEncoder(self.dense_model_name, self.sparse_model_name)
+        self._client = None
+        self.query_cache = None
+        query_cache_config = self.retrival_config['query_cache']
+        if query_cache_config['enabled']:
+            self.query_cache = QueryEmbeddingCache(
+                query_cache_config['max_entries'],
+                query_cache_config['ttl_seconds'],
+                query_cache_config['redis'],
+            )
+        self.result_cache = None
+        result_cache_config = self.retrival_config['result_cache']
+        if result_cache_config['enabled']:
+            self.result_cache = RetrievalResultCache(
+                result_cache_config['max_entries'],
+                result_cache_config['ttl_seconds'],
+                IndexVersions(config['indexing']['index_versions_path']),
+            )
     
     async def get_client(self):
-        client = AsyncQdrantClient(host=self.host, 
-                              port=self.port)
-        return client
+        """
+        Shared client for every search in this process. Created once (normally at
+        app startup) and kept open so searches reuse pooled connections.
+        """
+        if self._client is None:
+            cc = self.client_config
+            self._client = AsyncQdrantClient(
+                host=self.host,
+                port=self.port,
+                grpc_port=cc['grpc_port'],
+                prefer_grpc=cc['prefer_grpc'],
+                timeout=cc['timeout'],
+                limits=httpx.Limits(
+                    max_connections=cc['max_connections'],
+                    max_keepalive_connections=cc['max_keepalive_connections'],
+                    keepalive_expiry=cc['keepalive_expiry'],
+                ),
+            )
+        return self._client
     
-    async def search(self, text,query_filter):
+    def encode_query(self, text):
+        """Dense and sparse query vectors, checked against the query cache first."""
+        dense_vectors, sparse_vectors = self.encode_queries([text])
+        return dense_vectors[0], sparse_vectors[0]
+
+    def dense_search_params(self):
+        """Rescore int8-quantized dense candidates with the original vectors when quantization is on."""
+        if not self.quantization_config['enabled']:
+            return None
+        return models.SearchParams(
+            quantization=models.QuantizationSearchParams(
+                rescore=self.quantization_config['rescore'],
+                oversampling=self.quantization_config['oversampling'],
+            )
+        )
+
+    def cached_encode(self, model_name, encode, texts, sparse):
+        """Look texts up in the query cache and encode only the misses, in one model call."""
+        if self.query_cache is None:
+            return encode(texts)
+        vectors = self.query_cache.get_many(model_name, texts, sparse)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            encoded = encode(missing_texts)
+            for i, v in zip(missing, encoded):
+                vectors[i] = v
+            self.query_cache.put_many(model_name, missing_texts, encoded, sparse)
+        return vectors
+
+    def encode_queries(self, texts):
+        """
+        Dense and sparse vectors for all texts, one model call per encoder for the cache
+        misses. Queries stay out of the on-disk embedding cache, so they can't evict the
+        chunk vectors the indexer stored there.
+        """
+        dense = self.cached_encode(self.dense_model_name, partial(self.encoder.encode_dense, cached=False), texts, sparse=False)
+        sparse = self.cached_encode(self.sparse_model_name, partial(self.encoder.encode_sparse, cached=False), texts, sparse=True)
+        return [v.tolist() for v in dense], [to_sparse_vector(e) for e in sparse]
+
+    def hybrid_prefetch(self, dense_vector, sparse_vector):
+        return [
+            models.Prefetch(
+                query=dense_vector,
+                using=self.dense_vector_name,
+                params=self.dense_search_params(),
+            ),
+            models.Prefetch(
+                query=sparse_vector,
+                using=self.sparse_vector_name,
+            ),
+        ]
+
+    async def search(self, text, route):
         client = await self.get_client()
+        # Encoding is CPU-bound, keep it off the event loop
+        dense_vector, sparse_vector = await asyncio.to_thread(self.encode_query, text)
         search_result = await client.query_points(
-            collection_name=self.collection_name,
+            collection_name=route.collection_name,
             query=models.FusionQuery(
                 fusion=models.Fusion.RRF  # we are using reciprocal rank fusion here
             ),
-            prefetch=[
-                models.Prefetch(
-                    query=models.Document(text=text, model=self.dense_model_name),
-                    using=self.dense_vector_name,
-                ),
-                models.Prefetch(
-                    query=models.Document(text=text, model=self.sparse_model_name),
-                    using=self.sparse_vector_name,
-                ),
-            ],
-            query_filter=query_filter,
+            prefetch=self.hybrid_prefetch(dense_vector, sparse_vector),
+            query_filter=route.query_filter,
+            shard_key_selector=route.shard_key,
             limit=self.retrival_config['topn'] ,
         )
     
@@ -45,32 +135,94 @@ class QuadrantRetrieval:
         # response = [point.payload['text'] for point in search_result.points]
         metadata = [dict(point) for point in search_result.points]
         return metadata
+
+    async def search_batch(self, texts, route):
+        """
+        Hybrid search for several queries of one tenant in a single query_batch_points
+        request. Returns one result list per text, in order.
+        """
+        if not texts:
+            return []
+        client = await self.get_client()
+        dense_vectors, sparse_vectors = await asyncio.to_thread(self.encode_queries, texts)
+        requests = [
+            models.QueryRequest(
+                query=models.FusionQuery(fusion=models.Fusion.RRF),
+                prefetch=self.hybrid_prefetch(dense_vector, sparse_vector),
+                filter=route.query_filter,
+                shard_key=route.shard_key,
+                limit=self.retrival_config['topn'],
+                with_payload=True,
+            )
+            for dense_vector, sparse_vector in zip(dense_vectors, sparse_vectors)
+        ]
+        responses = await client.query_batch_points(collection_name=route.collection_name, requests=requests)
+        return [[dict(point) for point in response.points] for response in responses]
     
-    async def close_client(self):
+    def warm_up(self):
+        """Load both encoders and run one inference, so the first query doesn't pay for either."""
+        list(self.encoder.dense_model().embed(["warm up"]))
+        list(self.encoder.sparse_model().embed(["warm up"]))
+
+    async def ping(self):
         client = await self.get_client()
-        await client.close()
+        await client.get_collections()
+
+    async def close_client(self):
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.close()
     
     async def create_serach_filter(self, user_id):
-        return models.Filter(
-            must=[
-                models.FieldCondition(
-                    key="user_id", 
-                    match=models.MatchValue(value=user_id)
-                )
-            ]
-        )
+        return self.router.query_filter(user_id)
+
     async def process_search(self, text, user_id):
-        print("searching for ---",text)
-        query_filter = await self.create_serach_filter(user_id)
-        metadata = await self.search(text, query_filter)
-        print("result len---",len(metadata))
-        return metadata
+        results = await self.process_search_batch([text], user_id)
+        return results[0]
+
+    async def process_search_batch(self, texts, user_id):
+        """Per-text results, served from the result cache where possible; only misses are searched."""
+        print("searching for ---",texts)
+        results = [None] * len(texts)
+        keys = [None] * len(texts)
+        if self.result_cache is not None:
+            topn = self.retrival_config['topn']
+            keys = [self.result_cache.key(user_id, text, topn) for text in texts]
+            results = [self.result_cache.get(key) for key in keys]
+        missing = [i for i, metadata in enumerate(results) if metadata is None]
+        if missing:
+            route = self.router.route(user_id)
+            searched = await self.search_batch([texts[i] for i in missing], route)
+            for i, metadata in zip(missing, searched):
+                results[i] = metadata
+                if self.result_cache is not None:
+                    self.result_cache.put(keys[i], metadata)
+        print("result len---",[len(metadata) for metadata in results], f"({len(texts) - len(missing)} cached)")
+        return results
+
+
+def create_retrieval():
+    """Retrieval backend selected by retrival.backend in config.yaml ("qdrant" or "numpy")."""
+    backend = yaml.safe_load(open("config.yaml"))['retrival']['backend']
+    if backend == "numpy":
+        from numpy_retrieval import NumpyRetrieval  # numpy_retrieval imports this module
+        return NumpyRetrieval()
+    if backend != "qdrant":
+        raise ValueError(f"Unknown retrival.backend {backend!r}, expected 'qdrant' or 'numpy'")
+    return QuadrantRetrieval()
 
 
 if __name__ == "__main__":
-    qd = QuadrantRetrieval()
+    qd = create_retrieval()
     user_id = "alice"
     text = "Amazon q3 report"
-    metadata = asyncio.run(qd.process_search(text, user_id))
+
+    async def main():
+        try:
+            return await qd.process_search(text, user_id)
+        finally:
+            await qd.close_client()
+
+    metadata = asyncio.run(main())
     print(metadata)
 
@@ -0,0 +1,50 @@
+import time
+from collections import OrderedDict
+from query_embedding_cache import normalize_query
+
+
+class RetrievalResultCache:
+    """
+    LRU cache of search results with a TTL, keyed by
+    (user_id, normalized query, topn, index version).
+
+    The index version comes from IndexVersions, so entries cached before a
+    re-index of the tenant are never served again and age out of the LRU.
+    Cached result lists are shared between callers; treat them as read-only.
+    """
+
+    def __init__(self, max_entries, ttl_seconds, index_versions):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.index_versions = index_versions
+        self.entries = OrderedDict()  # key -> (expires_at, results)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, user_id, text, topn):
+        return (user_id, normalize_query(text), topn, self.index_versions.version(user_id))
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, results):
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, results)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,100 @@
+import asyncio
+
+
+class Flight:
+    """
+    One shared run of a frame stream. Frames are kept for the whole run, so a
+    subscriber that joins late gets everything from the first frame on.
+    """
+
+    def __init__(self):
+        self.frames = []
+        self.finished = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self.updated = asyncio.Event()
+
+    def notify(self):
+        updated, self.updated = self.updated, asyncio.Event()
+        updated.set()
+
+    def publish(self, frame):
+        self.frames.append(frame)
+        self.notify()
+
+    def finish(self, error=None):
+        self.finished = True
+        self.error = error
+        self.notify()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical streams: the first caller for a key starts the
+    stream in a background task, callers arriving while it runs subscribe to the
+    same frames. The run is cancelled when its last subscriber goes away, and the
+    key is released when it ends, so later callers start a new run.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.started = 0
+        self.joined = 0
+
+    def join(self, key, make_stream):
+        """(flight, True if this caller started it) for key; make_stream() is only called to start one."""
+        flight = self.flights.get(key)
+        if flight is not None:
+            self.joined += 1
+            return flight, False
+        flight = Flight()
+        self.flights[key] = flight
+        flight.task = asyncio.create_task(self.run(key, flight, make_stream()))
+        self.started += 1
+        return flight, True
+
+    async def run(self, key, flight, frames):
+        error = None
+        try:
+            async for frame in frames:
+                flight.publish(frame)
+        except Exception as e:
+            error = e  # handed to every subscriber
+        finally:
+            self.release(key, flight)
+            flight.finish(error)
+
+    def release(self, key, flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    async def subscribe(self, key, flight):
+        """Every frame of the flight, replaying the ones published before this call."""
+        flight.subscribers += 1
+        pos = 0
+        try:
+            while True:
+                while pos < len(flight.frames):
+                    yield flight.frames[pos]
+                    pos += 1
+                if flight.finished:
+                    if flight.error is not None:
+                        # A fresh exception per subscriber, so tracebacks don't pile up on the shared one
+                        raise RuntimeError(f"shared run for {key!r} failed: {flight.error}") from flight.error
+                    return
+                await flight.updated.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.finished:
+                # Nobody is listening any more; don't let a new caller join a cancelled run
+                self.release(key, flight)
+                flight.task.cancel()
+
+    def stats(self):
+        return {
+            "in_flight": len(self.flights),
+            "started": self.started,
+            "joined": self.joined,
+            "subscribers": sum(flight.subscribers for flight in self.flights.values()),
+        }
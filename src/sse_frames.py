@@ -0,0 +1,68 @@
+import asyncio, json, time
+
+# A token event is always {"type": "token", "token": <text>}; only the text is encoded per frame
+TOKEN_FRAME_PREFIX = b'data: {"type": "token", "token": '
+FRAME_END = b"\n\n"
+
+
+def encode_event(event):
+    """One SSE frame (bytes) for an event dict."""
+    return b"data: " + json.dumps(event, ensure_ascii=False).encode("utf-8") + FRAME_END
+
+
+def encode_tokens(text):
+    """Token event frame for text, byte-identical to encode_event({"type": "token", "token": text})."""
+    return TOKEN_FRAME_PREFIX + json.dumps(text, ensure_ascii=False).encode("utf-8") + b"}" + FRAME_END
+
+
+async def token_frames(tokens, max_delay, max_chars):
+    """
+    Token event frames for an async stream of tokens, coalescing the tokens that
+    arrive within max_delay seconds of the last frame (or until max_chars are
+    buffered) into one frame. The first token is sent at once. While tokens are
+    buffered the next one is awaited with a deadline, so a stalled generation
+    (e.g. a preempted request) doesn't hold them back; whatever is buffered is
+    sent at the end.
+    """
+    tokens = tokens.__aiter__()
+    buffer = []
+    buffered = 0
+    last_sent = float("-inf")
+    pending = None  # the next token, still awaited after a flush on the deadline
+    try:
+        while True:
+            if pending is None and not buffer:
+                try:
+                    token = await tokens.__anext__()
+                except StopAsyncIteration:
+                    break
+            else:
+                if pending is None:
+                    # A task, not wait_for: a timeout must not cancel the token stream
+                    pending = asyncio.ensure_future(tokens.__anext__())
+                timeout = max(last_sent + max_delay - time.monotonic(), 0) if buffer else None
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+                if not done:
+                    yield encode_tokens("".join(buffer))
+                    buffer.clear()
+                    buffered = 0
+                    last_sent = time.monotonic()
+                    continue
+                task, pending = pending, None
+                try:
+                    token = task.result()
+                except StopAsyncIteration:
+                    break
+            buffer.append(token)
+            buffered += len(token)
+            now = time.monotonic()
+            if buffered >= max_chars or now - last_sent >= max_delay:
+                yield encode_tokens("".join(buffer))
+                buffer.clear()
+                buffered = 0
+                last_sent = now
+        if buffer:
+            yield encode_tokens("".join(buffer))
+    finally:
+        if pending is not None:
+            pending.cancel()
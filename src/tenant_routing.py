@@ -0,0 +1,73 @@
+from collections import namedtuple
+from qdrant_client import models
+import yaml
+
+LAYOUTS = ("shared", "shard_key", "collection")
+
+TenantRoute = namedtuple("TenantRoute", ["collection_name", "shard_key", "query_filter", "user_id"])
+
+
+class TenantRouter:
+    """
+    Single place that decides where a tenant's (user_id's) points live.
+
+      shared     one collection (collection_name), tenants separated by the user_id filter only
+      shard_key  one custom-sharded collection (<collection_name>_sharded) with a shard key per tenant
+      collection one collection per tenant (<collection_name>_<user_id>)
+
+    Every layout uses its own collection name, so points can be copied between
+    layouts with migrate_tenant_layout.py. The user_id filter is kept in all
+    layouts as a second line of isolation.
+    """
+
+    def __init__(self, layout=None):
+        config = yaml.safe_load(open("config.yaml"))
+        self.base_collection_name = config['indexing']['collection_name']
+        self.layout = layout or config['indexing']['tenant_layout']
+        if self.layout not in LAYOUTS:
+            raise ValueError(f"Unknown tenant_layout {self.layout!r}, expected one of {LAYOUTS}")
+
+    def collection_for(self, user_id):
+        if self.layout == "collection":
+            return f"{self.base_collection_name}_{user_id}"
+        if self.layout == "shard_key":
+            return f"{self.base_collection_name}_sharded"
+        return self.base_collection_name
+
+    def shard_key_for(self, user_id):
+        return user_id if self.layout == "shard_key" else None
+
+    def query_filter(self, user_id):
+        return models.Filter(
+            must=[
+                models.FieldCondition(
+                    key="user_id",
+                    match=models.MatchValue(value=user_id)
+                )
+            ]
+        )
+
+    def route(self, user_id):
+        return TenantRoute(self.collection_for(user_id), self.shard_key_for(user_id), self.query_filter(user_id), user_id)
+
+    def collection_names(self, user_ids):
+        return sorted({self.collection_for(user_id) for user_id in user_ids})
+
+    def targets(self, user_ids):
+        """(collection_name, shard_key_selector) pairs covering every tenant in user_ids."""
+        user_ids = sorted(set(user_ids))
+        if self.layout == "shard_key":
+            return [(self.collection_for(None), user_ids)] if user_ids else []
+        return [(name, None) for name in self.collection_names(user_ids)]
+
+    def ensure_shard_keys(self, client, user_ids):
+        """Create the shard keys of new tenants (shard_key layout only)."""
+        if self.layout != "shard_key":
+            return
+        collection_name = self.collection_for(None)
+        info = client.collection_cluster_info(collection_name)
+        existing = {shard.shard_key for shard in list(info.local_shards) + list(info.remote_shards)}
+        for user_id in sorted(set(user_ids)):
+            if user_id not in existing:
+                client.create_shard_key(collection_name, user_id)
+                print(f"Created shard key--{user_id}")
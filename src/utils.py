@@ -24,3 +24,46 @@ def parse_reasoning_and_queries(assistant_resposne):
 
     return reasoning, queries
 
+
+
+class ExpandedQueryParser:
+    """
+    Incremental parse_reasoning_and_queries for a streamed query breakdown: feed()
+    the generated text as it arrives and get back each "N. query" (or "N) query")
+    line after "Answer:" as soon as the line is complete, including a first item on
+    the "Answer:" line itself.
+    """
+    QUERY_LINE = re.compile(r"\s*\d+[.)]\s*(.*\S)")
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None  # start of the next unparsed line, once "Answer:" has been seen
+
+    def feed(self, text):
+        self.buffer += text
+        return self.parse_lines(final=False)
+
+    def close(self):
+        """Queries on a last line that ended without a newline."""
+        return self.parse_lines(final=True)
+
+    def parse_lines(self, final):
+        if self.pos is None:
+            answer = self.buffer.find("Answer:")
+            if answer == -1:
+                return []
+            self.pos = answer + len("Answer:")
+        queries = []
+        while True:
+            end = self.buffer.find("\n", self.pos)
+            if end == -1:
+                if not final:
+                    break
+                end = len(self.buffer)
+            match = self.QUERY_LINE.match(self.buffer, self.pos, end)
+            if match:
+                queries.append(match.group(1))
+            self.pos = end + 1
+            if end == len(self.buffer):
+                break
+        return queries
@@ -0,0 +1,38 @@
+import random
+import pytest
+import chunker
+from chunker import SpanChunker, WhitespaceTokenizer, load_tokenizer
+
+
+@pytest.mark.parametrize("max_tokens, overlap_tokens", [(1, 25), (10, 10), (10, 11), (10, -1), (0, 0)])
+def test_invalid_overlap_is_rejected(max_tokens, overlap_tokens):
+    with pytest.raises(ValueError):
+        SpanChunker(max_tokens, overlap_tokens, WhitespaceTokenizer())
+
+
+@pytest.mark.parametrize("max_tokens, overlap_tokens", [(1, 0), (2, 1), (5, 4), (20, 5), (64, 0)])
+def test_spans_cover_every_token_in_order(max_tokens, overlap_tokens):
+    rng = random.Random(max_tokens * 100 + overlap_tokens)
+    words = ["alpha", "beta.", "gamma", "delta!", "epsilon", "zeta?", "eta"]
+    text = " ".join(rng.choice(words) for _ in range(300))
+    chunker = SpanChunker(max_tokens, overlap_tokens, WhitespaceTokenizer())
+    offsets = WhitespaceTokenizer().offsets(text)
+
+    spans = chunker.split(text)
+
+    covered = set()
+    for start, end in spans:
+        assert start < end
+        covered.update(i for i, (s, e) in enumerate(offsets) if s >= start and e <= end)
+    assert covered == set(range(len(offsets)))
+    assert [s for s, _ in spans] == sorted({s for s, _ in spans})
+
+
+def test_tokenizer_fallback_only_when_allowed(monkeypatch):
+    def offline(name):
+        raise OSError("offline")
+
+    monkeypatch.setattr(chunker, "HFTokenizer", offline)
+    assert isinstance(load_tokenizer("model"), WhitespaceTokenizer)
+    with pytest.raises(RuntimeError):
+        load_tokenizer("model", fallback=False)
@@ -0,0 +1,26 @@
+from context_packing import ContextPacker, overlap_length
+
+
+def test_overlap_length_long_and_short_overlaps():
+    tail = "the shared tail of the previous chunk"
+    assert overlap_length("x" * 40 + " " + tail, tail + " and more") == len(tail)
+    assert overlap_length("abc def", "def ghi") == 3
+    assert overlap_length("abc def", "ghi jkl") == 0
+    # A shared letter at the seam is not an overlap
+    assert overlap_length("the", "e cat") == 0
+
+
+def test_merge_passages_joins_consecutive_chunks_across_pages():
+    payloads = [
+        {"pdf_name": "a", "page": 2, "chunk_id": 8, "text": "end of page one. start of page two"},
+        {"pdf_name": "a", "page": 1, "chunk_id": 7, "text": "more text at the end of page one."},
+        {"pdf_name": "b", "page": 1, "chunk_id": 8, "text": "other pdf"},
+    ]
+    passages = ContextPacker.merge_passages(None, payloads)
+    assert passages[0] == {
+        "pdf_name": "a",
+        "page": 1,
+        "chunk_ids": [7, 8],
+        "text": "more text at the end of page one. start of page two",
+    }
+    assert passages[1]["chunk_ids"] == [8] and passages[1]["pdf_name"] == "b"
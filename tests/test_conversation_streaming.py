@@ -0,0 +1,164 @@
+import asyncio, json
+import types
+import pytest
+from answer_cache import AnswerCache
+from chunker import WhitespaceTokenizer
+from conversation_streaming import EarningConversation
+from prompt_assembly import PromptAssembler
+
+BREAKDOWN = "Reasoning: split it\nAnswer:\n1. AWS revenue\n2. ads growth\n3. operating income\n4. extra\n"
+
+
+class FakeStore:
+    def __init__(self):
+        self.data = {}
+
+    async def load(self, key):
+        return list(self.data.get(key, []))
+
+    async def append(self, key, role, content):
+        self.data.setdefault(key, []).append({"role": role, "content": content})
+
+    async def extend(self, key, messages):
+        self.data.setdefault(key, []).extend(messages)
+
+
+class FakeStream:
+    """Streams text in 4-character deltas, delay seconds apart; fail_after raises after that many deltas."""
+
+    def __init__(self, text, delay=0.0, fail_after=None):
+        self.deltas = [text[i:i + 4] for i in range(0, len(text), 4)]
+        self.delay = delay
+        self.fail_after = fail_after
+        self.closed = False
+        self.response = self
+
+    async def aclose(self):
+        self.closed = True
+
+    async def __aiter__(self):
+        for i, delta in enumerate(self.deltas):
+            if i == self.fail_after:
+                raise ConnectionError("stream dropped")
+            await asyncio.sleep(self.delay)
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=delta))])
+
+
+class FakeRetrieval:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    async def process_search_batch(self, texts, user_id):
+        await asyncio.sleep(self.delay)
+        return [[{"id": text, "score": 1.0, "payload": {"pdf_name": text, "chunk_id": 0}}] for text in texts]
+
+
+def make_conversation(stream, qd=None, expansion_deadline=1.0):
+    ec = EarningConversation.__new__(EarningConversation)
+    ec.model = "model"
+    ec.generation_profiles = {"breakdown": {
+        "max_tokens": 64, "temperature": 0.0, "top_p": 1.0, "frequency_penalty": 0.0, "presence_penalty": 0.0, "stop": None,
+    }}
+    ec.prompt_assembler = PromptAssembler(WhitespaceTokenizer())
+    ec.fusion_config = {"topn": 5, "rrf_k": 60}
+    ec.speculative_config = {"enabled": True, "expansion_deadline": expansion_deadline, "short_query_words": 0, "expand_keywords": []}
+    ec.speculation_metrics = {key: 0 for key in (
+        "turns", "expansion_skipped", "expansion_timeouts", "expansion_errors", "expansion_merged", "expansion_changed_topk",
+    )}
+    ec.qd = qd or FakeRetrieval()
+
+    async def create(**kwargs):
+        return stream
+
+    async def get_client():
+        return types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+
+    ec.get_client = get_client
+    return ec
+
+
+async def collect(agen):
+    return [item async for item in agen]
+
+
+def test_breakdown_is_saved_after_the_third_query():
+    store = FakeStore()
+    stream = FakeStream(BREAKDOWN)
+    ec = make_conversation(stream)
+    queries = asyncio.run(collect(ec.stream_expanded_queries("alice", "question", store)))
+    assert queries == ["AWS revenue", "ads growth", "operating income"]
+    assert stream.closed
+    assert store.data["alice_q_breakdown"][1]["content"].endswith("3. operating income")
+
+
+def test_failed_breakdown_is_not_saved():
+    store = FakeStore()
+    stream = FakeStream(BREAKDOWN, fail_after=10)
+    ec = make_conversation(stream)
+    with pytest.raises(ConnectionError):
+        asyncio.run(collect(ec.stream_expanded_queries("alice", "question", store)))
+    assert stream.closed
+    assert store.data == {}
+
+
+def test_cancelled_breakdown_is_not_saved():
+    store = FakeStore()
+    stream = FakeStream(BREAKDOWN, delay=0.05)
+    ec = make_conversation(stream)
+
+    async def main():
+        task = asyncio.create_task(collect(ec.stream_expanded_queries("alice", "question", store)))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert stream.closed
+    assert store.data == {}
+
+
+def test_speculative_timeout_leaves_breakdown_history_unchanged():
+    store = FakeStore()
+    history = [{"role": "user", "content": "earlier"}, {"role": "assistant", "content": "Answer:\n1. earlier query"}]
+    store.data["alice_q_breakdown"] = list(history)
+    stream = FakeStream(BREAKDOWN, delay=0.05)  # ~1.5s for the whole breakdown
+    ec = make_conversation(stream, expansion_deadline=0.2)
+
+    queries, top_points = asyncio.run(ec.retrieve_speculative("alice", "how did revenue and margins trend", store))
+
+    assert queries == ["how did revenue and margins trend"]
+    assert [p["id"] for p in top_points] == ["how did revenue and margins trend"]
+    assert ec.speculation_metrics["expansion_timeouts"] == 1
+    assert stream.closed
+    assert store.data == {"alice_q_breakdown": history}
+
+
+class FakePacker:
+    def __init__(self):
+        self.packed = []
+
+    def pack(self, metadata_list):
+        self.packed.append(metadata_list)
+        return "context", {"packed_tokens": 0}
+
+
+@pytest.mark.parametrize("speculative", [True, False])
+def test_answer_cache_does_not_change_the_context(speculative):
+    def answer_metadata(cache):
+        ec = make_conversation(FakeStream(BREAKDOWN))
+        ec.speculative_config["enabled"] = speculative
+        ec.context_packer = FakePacker()
+        ec.streaming_config = {"max_delay": 0.0, "max_chars": 1}
+        ec.answer_cache = None
+        if cache:
+            ec.answer_cache = AnswerCache(10, 60, None, "v", types.SimpleNamespace(version=lambda user_id: 0))
+
+        async def answer(*args):
+            yield "ok"
+
+        ec.start_process_with_history_stream = answer
+        frames = asyncio.run(collect(ec.respond_stream("alice", "how did revenue and margins trend", FakeStore())))
+        return ec.context_packer.packed, json.loads(frames[0][len(b"data: "):])["queries"]
+
+    assert answer_metadata(cache=True) == answer_metadata(cache=False)
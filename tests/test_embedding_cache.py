@@ -0,0 +1,44 @@
+import multiprocessing
+import numpy as np
+from embedding_cache import EmbeddingStore
+
+# 4 float32 values = 16 bytes per entry; a 5th entry compacts the store down to 3
+MAX_BYTES = 64
+
+
+def vector(i):
+    return np.full(4, i, dtype=np.float32)
+
+
+def put(path, keys):
+    store = EmbeddingStore(path, sparse=False, max_bytes=MAX_BYTES)
+    store.put_many([(key, vector(ord(key)), None) for key in keys])
+
+
+def test_recency_survives_a_restart(tmp_path):
+    path = str(tmp_path)
+    put(path, "abcd")
+    # Another run reads "a"; it must count as more recent than "b", "c" and "d"
+    assert EmbeddingStore(path, sparse=False, max_bytes=MAX_BYTES).get_many(["a"])[0] is not None
+    put(path, "e")
+
+    store = EmbeddingStore(path, sparse=False, max_bytes=MAX_BYTES)
+    cached = dict(zip("abcde", store.get_many(list("abcde"))))
+    assert sorted(key for key, v in cached.items() if v is not None) == ["a", "d", "e"]
+    assert all(np.array_equal(v, vector(ord(key))) for key, v in cached.items() if v is not None)
+
+
+def test_writes_and_compaction_of_another_process_are_picked_up(tmp_path):
+    path = str(tmp_path)
+    store = EmbeddingStore(path, sparse=False, max_bytes=MAX_BYTES)
+    store.put_many([("a", vector(ord("a")), None)])
+
+    ctx = multiprocessing.get_context("spawn")
+    child = ctx.Process(target=put, args=(path, "bcde"))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+
+    cached = dict(zip("abcde", store.get_many(list("abcde"))))
+    assert sorted(key for key, v in cached.items() if v is not None) == ["c", "d", "e"]
+    assert all(np.array_equal(v, vector(ord(key))) for key, v in cached.items() if v is not None)
@@ -0,0 +1,35 @@
+from fusion import fuse_results
+
+
+def point(pdf_name, chunk_id, score=1.0):
+    return {"id": f"{pdf_name}/{chunk_id}", "score": score, "payload": {"pdf_name": pdf_name, "chunk_id": chunk_id}}
+
+
+def ids(points):
+    return [p["id"] for p in points]
+
+
+def test_chunks_found_by_several_queries_rank_first():
+    fused = fuse_results([
+        [point("a", 1), point("a", 2), point("b", 1)],
+        [point("c", 1), point("b", 1)],
+    ], limit=10, rrf_k=60)
+    assert ids(fused) == ["b/1", "a/1", "c/1", "a/2"]
+    assert fused[0]["score"] == 1 / 63 + 1 / 62
+
+
+def test_ranks_not_scores_are_fused():
+    fused = fuse_results([[point("a", 1, score=0.1)], [point("b", 1, score=99.0)], [point("a", 1, score=0.1)]], limit=10)
+    assert ids(fused) == ["a/1", "b/1"]
+
+
+def test_ties_keep_first_occurrence_order_and_limit():
+    fused = fuse_results([[point("a", 1)], [point("b", 1)], [point("c", 1)]], limit=2)
+    assert ids(fused) == ["a/1", "b/1"]
+
+
+def test_each_chunk_is_returned_once_as_a_copy():
+    first = point("a", 1, score=0.5)
+    fused = fuse_results([[first], [point("a", 1, score=0.9)]], limit=10)
+    assert len(fused) == 1 and fused[0]["id"] == "a/1"
+    assert fused[0] is not first and first["score"] == 0.5
@@ -0,0 +1,64 @@
+import json
+import pytest
+from index_manifest import MANIFEST_VERSION, IndexManifest, point_entry, point_id
+
+
+def row(text, user_id="alice", pdf_name="2023_Q3_AMZN", chunk_id=0):
+    return {"pdf_name": pdf_name, "page": 3, "chunk_id": chunk_id, "text": text, "user_id": user_id}
+
+
+def corpus(*rows):
+    return {point_id(r["pdf_name"], r["page"], r["chunk_id"], r["text"]): point_entry(r) for r in rows}
+
+
+def test_changed_stale_and_moved_points(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "index_manifest.json"))
+    kept, edited, moved = row("kept", chunk_id=0), row("old text", chunk_id=1), row("moved", chunk_id=2)
+    manifest.points = corpus(kept, edited, moved)
+
+    current = corpus(kept, row("new text", chunk_id=1), row("moved", user_id="bob", chunk_id=2))
+    to_upsert, stale = manifest.diff_points(current)
+
+    (edited_id,), (new_id,) = corpus(edited), corpus(row("new text", chunk_id=1))
+    (moved_id,) = corpus(moved)
+    assert sorted(to_upsert) == sorted([new_id, moved_id])
+    assert stale == [edited_id]
+    # Same id, new owner: its old copy is deleted from the tenant it was uploaded for
+    assert [pid for pid in to_upsert if pid in manifest.points] == [moved_id]
+    assert manifest.tenants_for([moved_id]) == {"alice"}
+
+
+def test_v1_manifest_is_migrated_and_saved_as_current_version(tmp_path):
+    path = tmp_path / "index_manifest.json"
+    r = row("text")
+    (pid, entry), = corpus(r).items()
+    pdfs = {"2023_Q3_AMZN": {"sha256": "x", "user_id": "alice", "chunking": "c"}}
+    path.write_text(json.dumps({"pdfs": pdfs, "points": {pid: entry[2]}}))
+
+    manifest = IndexManifest(str(path))
+    assert manifest.points == {pid: [None, None, entry[2]]}
+    # Unknown pdf/tenant: re-upserted once, and deletes go to every known tenant
+    assert manifest.diff_points(corpus(r)) == ([pid], [])
+    assert manifest.tenants_for([pid], fallback=["bob"]) == {"alice", "bob"}
+
+    manifest.points = corpus(r)
+    manifest.save()
+    data = json.loads(path.read_text())
+    assert data["version"] == MANIFEST_VERSION
+    assert IndexManifest(str(path)).points == corpus(r)
+
+
+def test_v2_manifest_takes_the_tenant_from_the_pdf(tmp_path):
+    path = tmp_path / "index_manifest.json"
+    r = row("text")
+    (pid, entry), = corpus(r).items()
+    pdfs = {"2023_Q3_AMZN": {"sha256": "x", "user_id": "alice", "chunking": "c"}}
+    path.write_text(json.dumps({"version": 2, "pdfs": pdfs, "points": {pid: [entry[0], entry[2]]}}))
+    assert IndexManifest(str(path)).points == {pid: entry}
+
+
+def test_newer_manifest_is_rejected(tmp_path):
+    path = tmp_path / "index_manifest.json"
+    path.write_text(json.dumps({"version": MANIFEST_VERSION + 1, "pdfs": {}, "points": {}}))
+    with pytest.raises(ValueError):
+        IndexManifest(str(path))
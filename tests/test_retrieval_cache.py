@@ -0,0 +1,40 @@
+import json
+from index_versions import IndexVersions
+from retrieval_cache import RetrievalResultCache
+
+
+def test_bumping_a_tenant_invalidates_only_its_results(tmp_path):
+    versions_path = tmp_path / "index_versions.json"
+    cache = RetrievalResultCache(10, 60, IndexVersions(str(versions_path)))
+    alice, bob = cache.key("alice", "AWS revenue", 5), cache.key("bob", "AWS revenue", 5)
+    cache.put(alice, ["alice result"])
+    cache.put(bob, ["bob result"])
+
+    # An indexer in another process bumps alice's version
+    IndexVersions(str(versions_path)).bump(["alice"])
+    assert json.loads(versions_path.read_text()) == {"alice": 1}
+
+    assert cache.get(cache.key("alice", "AWS revenue", 5)) is None
+    assert cache.get(cache.key("bob", "AWS revenue", 5)) == ["bob result"]
+
+
+def test_key_normalizes_the_query_and_includes_topn(tmp_path):
+    cache = RetrievalResultCache(10, 60, IndexVersions(str(tmp_path / "index_versions.json")))
+    cache.put(cache.key("alice", "AWS  Revenue ", 5), ["result"])
+    assert cache.get(cache.key("alice", "aws revenue", 5)) == ["result"]
+    assert cache.get(cache.key("alice", "aws revenue", 10)) is None
+
+
+def test_expired_and_least_recently_used_entries_are_dropped(tmp_path):
+    versions = IndexVersions(str(tmp_path / "index_versions.json"))
+    cache = RetrievalResultCache(2, 60, versions)
+    a, b, c = (cache.key("alice", q, 5) for q in "abc")
+    cache.put(a, ["a"])
+    cache.put(b, ["b"])
+    assert cache.get(a) == ["a"]
+    cache.put(c, ["c"])
+    assert cache.get(b) is None and cache.get(a) == ["a"]
+
+    expired = RetrievalResultCache(2, -1, versions)
+    expired.put(a, ["a"])
+    assert expired.get(a) is None
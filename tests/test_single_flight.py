@@ -0,0 +1,124 @@
+import asyncio
+import types
+import pytest
+from answer_cache import AnswerCache
+from conversation_streaming import EarningConversation
+from single_flight import SingleFlight
+from sse_frames import encode_event
+
+
+async def frames(n, delay=0.01, error=None):
+    for i in range(n):
+        await asyncio.sleep(delay)
+        yield i
+    if error is not None:
+        raise error
+
+
+def test_late_joiner_gets_every_frame_from_one_run():
+    flights = SingleFlight()
+    runs = []
+
+    def make_stream():
+        runs.append(1)
+        return frames(5)
+
+    async def subscriber(delay):
+        await asyncio.sleep(delay)
+        flight, leader = flights.join("key", make_stream)
+        return leader, [frame async for frame in flights.subscribe("key", flight)]
+
+    async def main():
+        return await asyncio.gather(subscriber(0), subscriber(0.03))
+
+    (leader, first), (joined_leader, late) = asyncio.run(main())
+    assert len(runs) == 1 and leader and not joined_leader
+    assert first == late == [0, 1, 2, 3, 4]
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_each_subscriber_gets_its_own_exception():
+    flights = SingleFlight()
+    error = ValueError("boom")
+
+    async def subscriber():
+        flight, _ = flights.join("key", lambda: frames(2, error=error))
+        try:
+            async for _ in flights.subscribe("key", flight):
+                pass
+        except RuntimeError as e:
+            return e
+
+    async def main():
+        return await asyncio.gather(subscriber(), subscriber())
+
+    first, second = asyncio.run(main())
+    assert first is not second
+    assert first.__cause__ is error and second.__cause__ is error
+
+
+class FakeStore:
+    def __init__(self):
+        self.data = {}
+
+    async def append(self, key, role, content):
+        self.data.setdefault(key, []).append({"role": role, "content": content})
+
+    async def extend(self, key, messages):
+        self.data.setdefault(key, []).extend(messages)
+
+
+def make_conversation(answer_cache=None):
+    ec = EarningConversation.__new__(EarningConversation)
+    ec.single_flight = SingleFlight()
+    ec.answer_cache = answer_cache
+    ec.fusion_config = {"topn": 5, "rrf_k": 60}
+    ec.runs = 0
+
+    async def process_search_batch(texts, user_id):
+        return [[{"id": text, "score": 1.0, "payload": {"pdf_name": text, "chunk_id": 0}}] for text in texts]
+
+    async def answer_stream(user_id, user_query, redis_store, raw_results=None):
+        # Saves its turn like start_process_with_history_stream
+        ec.runs += 1
+        await asyncio.sleep(0.05)
+        await redis_store.append(user_id, "user", user_query)
+        await redis_store.append(user_id, "assistant", "answer")
+        yield encode_event({"type": "done", "answer": "answer", "metadata": []})
+
+    ec.qd = types.SimpleNamespace(process_search_batch=process_search_batch)
+    ec.answer_stream = answer_stream
+    return ec
+
+
+def turns(store, user_id):
+    return [message["content"] for message in store.data[user_id]]
+
+
+def test_coalesced_requests_each_save_a_turn():
+    ec = make_conversation()
+    store = FakeStore()
+
+    async def ask(query):
+        return [frame async for frame in ec.retrive_context_for_multiple_queries_stream("alice", query, store)]
+
+    async def main():
+        return await asyncio.gather(ask("AWS revenue?"), ask("aws  revenue?"))
+
+    first, second = asyncio.run(main())
+    assert ec.runs == 1 and first == second
+    assert sorted(turns(store, "alice")) == sorted(["AWS revenue?", "answer", "aws  revenue?", "answer"])
+
+
+def test_answer_cache_hits_each_save_a_turn():
+    cache = AnswerCache(10, 60, None, "v", types.SimpleNamespace(version=lambda user_id: 0))
+    ec = make_conversation(cache)
+    store = FakeStore()
+
+    async def main():
+        for _ in range(3):
+            [frame async for frame in ec.retrive_context_for_multiple_queries_stream("alice", "AWS revenue?", store)]
+
+    asyncio.run(main())
+    assert ec.runs == 1 and cache.hits == 2
+    assert turns(store, "alice") == ["AWS revenue?", "answer"] * 3
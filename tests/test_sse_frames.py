@@ -0,0 +1,45 @@
+import asyncio
+import json
+import time
+from sse_frames import encode_event, encode_tokens, token_frames
+
+
+def frame_text(frame):
+    return json.loads(frame[len(b"data: "):])["token"]
+
+
+async def stalled_tokens():
+    yield "a"
+    yield "b"
+    await asyncio.sleep(0.5)  # e.g. the request was preempted
+    yield "c"
+
+
+async def timed_frames(tokens, max_delay, max_chars):
+    start = time.monotonic()
+    return [(frame_text(frame), time.monotonic() - start) async for frame in token_frames(tokens, max_delay, max_chars)]
+
+
+def test_encode_tokens_matches_encode_event():
+    for text in ["plain", 'quote " and\nnewline', "ünïcode 数"]:
+        assert encode_tokens(text) == encode_event({"type": "token", "token": text})
+
+
+def test_buffered_tokens_are_sent_on_the_deadline_during_a_stall():
+    frames = asyncio.run(timed_frames(stalled_tokens(), 0.05, 256))
+    assert [text for text, _ in frames] == ["a", "b", "c"]
+    # "b" goes out when its window closes, not when "c" ends the stall
+    assert frames[1][1] < 0.25
+    assert frames[2][1] >= 0.5
+
+
+def test_tokens_within_the_window_share_a_frame():
+    async def fast_tokens():
+        for i in range(50):
+            await asyncio.sleep(0.001)
+            yield f"t{i} "
+
+    frames = asyncio.run(timed_frames(fast_tokens(), 10.0, 40))
+    assert "".join(text for text, _ in frames) == "".join(f"t{i} " for i in range(50))
+    assert frames[0][0] == "t0 "
+    assert len(frames) < 50 and all(len(text) <= 40 + 4 for text, _ in frames)
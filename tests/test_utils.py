@@ -0,0 +1,25 @@
+from utils import ExpandedQueryParser
+
+
+def feed_chars(parser, text):
+    """Queries returned by feed(), per character fed."""
+    return [parser.feed(c) for c in text]
+
+
+def test_item_on_the_answer_line_is_emitted_when_its_line_ends():
+    parser = ExpandedQueryParser()
+    emitted = feed_chars(parser, "Reasoning: split it\nAnswer: 1. AWS revenue\n")
+    assert emitted[-1] == ["AWS revenue"]
+    assert all(not queries for queries in emitted[:-1])
+
+
+def test_parenthesis_numbering_and_last_line_on_close():
+    parser = ExpandedQueryParser()
+    assert parser.feed("Answer:\n1) AWS revenue\n2) ads") == ["AWS revenue"]
+    assert parser.feed(" growth\n3) op") == ["ads growth"]
+    assert parser.close() == ["op"]
+
+
+def test_numbered_reasoning_lines_are_ignored():
+    parser = ExpandedQueryParser()
+    assert parser.feed("Reasoning:\n1. not a query\nAnswer:\n1. query\n") == ["query"]